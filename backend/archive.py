@@ -0,0 +1,302 @@
+"""Workspace ingestion from uploaded tar/zip archives.
+
+The upload is streamed into an anonymous temp file while its size is checked,
+then opened as a read-only mapping of ``path -> text``. Only the member table
+is kept in memory; file contents are read from the spooled archive (memory
+mapped for tarballs) when a path is looked up, so memory use does not grow
+with repository size.
+"""
+
+import bz2
+import gzip
+import lzma
+import mmap
+import posixpath
+import tarfile
+import tempfile
+import zipfile
+from collections.abc import Mapping
+from typing import IO, AsyncIterator, Iterator, NamedTuple
+
+from pydantic import BaseModel
+
+SNIFF_BYTES = 8192
+
+_DECOMPRESSORS = (
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+)
+
+
+class ArchiveError(ValueError):
+    def __init__(self, message: str, status: int = 422) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class ArchiveLimits(BaseModel):
+    max_upload_bytes: int
+    max_files: int
+    max_file_bytes: int
+    max_total_bytes: int
+
+
+class SpooledUpload(NamedTuple):
+    file: IO[bytes]
+    filename: str
+    fields: dict[str, str]
+
+
+async def spool_multipart(
+    body: AsyncIterator[bytes],
+    content_type: str,
+    limits: ArchiveLimits,
+    field_name: str = "archive",
+) -> SpooledUpload:
+    """Stream a multipart/form-data body, writing the archive part to a temp file.
+
+    Other parts are kept as short text fields. The upload is rejected as soon as
+    the archive grows past ``limits.max_upload_bytes``.
+    """
+    # Imported here so the rest of the backend runs without python-multipart.
+    try:
+        from python_multipart.exceptions import FormParserError
+        from python_multipart.multipart import MultipartParser, parse_options_header
+    except ImportError as error:
+        raise ArchiveError("Archive uploads need the python-multipart package.", status=501) from error
+
+    mime, options = parse_options_header(content_type)
+    if mime != b"multipart/form-data" or b"boundary" not in options:
+        raise ArchiveError("Expected a multipart/form-data upload.", status=415)
+
+    spool = tempfile.TemporaryFile()
+    fields: dict[str, str] = {}
+    headers: dict[str, str] = {}
+    header: list[bytes] = [b"", b""]
+    value = bytearray()
+    written = 0
+    name = filename = ""
+
+    def on_part_begin() -> None:
+        headers.clear()
+        value.clear()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header[0] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header[1] += data[start:end]
+
+    def on_header_end() -> None:
+        headers[header[0].decode("latin-1").lower()] = header[1].decode("latin-1")
+        header[0] = header[1] = b""
+
+    def on_headers_finished() -> None:
+        nonlocal name, filename
+        _, disposition = parse_options_header(headers.get("content-disposition", ""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if name == field_name:
+            filename = disposition.get(b"filename", b"").decode("utf-8", "replace")
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        nonlocal written
+        if name == field_name:
+            written += end - start
+            if written > limits.max_upload_bytes:
+                raise ArchiveError(f"Archive exceeds {limits.max_upload_bytes} bytes.", status=413)
+            spool.write(data[start:end])
+        else:
+            value.extend(data[start:end])
+            if len(value) > 1024:
+                raise ArchiveError(f"Form field {name!r} is too long.")
+
+    def on_part_end() -> None:
+        if name and name != field_name:
+            fields[name] = value.decode("utf-8", "replace")
+
+    parser = MultipartParser(
+        options[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    try:
+        async for chunk in body:
+            parser.write(chunk)
+        parser.finalize()
+    except FormParserError as error:
+        spool.close()
+        raise ArchiveError(f"Malformed multipart body: {error}") from error
+    except BaseException:
+        spool.close()
+        raise
+
+    if not written:
+        spool.close()
+        raise ArchiveError(f"No {field_name!r} file part in the upload.")
+    spool.seek(0)
+    return SpooledUpload(file=spool, filename=filename, fields=fields)
+
+
+class _Member(BaseModel):
+    size: int
+    offset: int = -1
+    name: str = ""
+
+
+class ArchiveWorkspace(Mapping[str, str]):
+    """Text files of a tar or zip archive, read on demand.
+
+    Binary members (a NUL byte or invalid UTF-8 in their first bytes) and files
+    over ``max_file_bytes`` are skipped and counted. Exceeding ``max_files`` or
+    ``max_total_bytes`` of accepted text rejects the archive outright.
+    """
+
+    def __init__(self, spool: IO[bytes], limits: ArchiveLimits) -> None:
+        self.limits = limits
+        self.skipped_binary = 0
+        self.skipped_large = 0
+        self._files: list[IO[bytes]] = [spool]
+        self._zip: zipfile.ZipFile | None = None
+        self._members: dict[str, _Member] = {}
+        self._map: mmap.mmap | None = None
+        try:
+            self._open(spool)
+        except BaseException:
+            self.close()
+            raise
+
+    def __getitem__(self, path: str) -> str:
+        return self._read(self._members[path]).decode("utf-8", "replace")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._members)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def summary(self) -> str:
+        return (
+            f"Unpacked {len(self._members)} text files; skipped {self.skipped_binary} binary "
+            f"and {self.skipped_large} oversized files."
+        )
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+        if self._map is not None:
+            self._map.close()
+        for handle in self._files:
+            handle.close()
+
+    def _open(self, spool: IO[bytes]) -> None:
+        spool.seek(0)
+        magic = spool.read(6)
+        spool.seek(0)
+        for signature, decompressor in _DECOMPRESSORS:
+            if magic.startswith(signature):
+                spool = self._decompress(decompressor(spool, "rb"))
+                break
+
+        size = spool.seek(0, 2)
+        if not size:
+            raise ArchiveError("The uploaded archive is empty.")
+        if zipfile.is_zipfile(spool):
+            # Zip members are usually deflated, so they are read through the
+            # file handle rather than a mapping.
+            try:
+                self._zip = zipfile.ZipFile(spool)
+            except zipfile.BadZipFile as error:
+                raise ArchiveError(f"Not a readable zip archive: {error}") from error
+            entries = [
+                (info.filename, _Member(size=info.file_size, name=info.filename))
+                for info in self._zip.infolist()
+                if not info.is_dir()
+            ]
+        else:
+            self._map = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                with tarfile.open(fileobj=self._map, mode="r:") as archive:
+                    entries = [
+                        (info.name, _Member(size=info.size, offset=info.offset_data))
+                        for info in archive
+                        if info.isreg()
+                    ]
+            except tarfile.TarError as error:
+                raise ArchiveError(f"Not a readable tar or zip archive: {error}") from error
+
+        paths = [_safe_path(name) for name, _ in entries]
+        prefix = _common_root(paths)
+        total = 0
+        for path, (_, member) in zip(paths, entries):
+            if member.size > self.limits.max_file_bytes:
+                self.skipped_large += 1
+                continue
+            if _is_binary(self._read(member, SNIFF_BYTES)):
+                self.skipped_binary += 1
+                continue
+            total += member.size
+            if total > self.limits.max_total_bytes:
+                raise ArchiveError(f"Archive expands past {self.limits.max_total_bytes} bytes of text.", status=413)
+            if len(self._members) == self.limits.max_files:
+                raise ArchiveError(f"Archive has more than {self.limits.max_files} text files.", status=413)
+            self._members[path[len(prefix) :]] = member
+        if not self._members:
+            raise ArchiveError("The archive contains no text files.")
+
+    def _decompress(self, stream: IO[bytes]) -> IO[bytes]:
+        """Inflate a compressed tarball into a second temp file so members can be mapped."""
+        target = tempfile.TemporaryFile()
+        self._files.append(target)
+        budget = self.limits.max_total_bytes * 2
+        try:
+            with stream:
+                while chunk := stream.read(1024 * 1024):
+                    budget -= len(chunk)
+                    if budget < 0:
+                        raise ArchiveError("Decompressed archive is too large.", status=413)
+                    target.write(chunk)
+        except (OSError, EOFError, lzma.LZMAError) as error:
+            raise ArchiveError(f"Could not decompress the archive: {error}") from error
+        return target
+
+    def _read(self, member: _Member, limit: int | None = None) -> bytes:
+        limit = min(member.size if limit is None else limit, self.limits.max_file_bytes)
+        if self._zip is not None:
+            with self._zip.open(member.name) as handle:
+                return handle.read(limit)
+        assert self._map is not None
+        return self._map[member.offset : member.offset + min(member.size, limit)]
+
+
+def _safe_path(name: str) -> str:
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if path.startswith("/") or path == ".." or path.startswith("../"):
+        raise ArchiveError(f"Archive member {name!r} escapes the workspace root.")
+    return path
+
+
+def _common_root(paths: list[str]) -> str:
+    """Return the single top-level directory shared by every path (e.g. ``repo-main/``), if any."""
+    roots = {path.partition("/")[0] for path in paths}
+    if len(roots) == 1 and all("/" in path for path in paths):
+        return f"{roots.pop()}/"
+    return ""
+
+
+def _is_binary(head: bytes) -> bool:
+    if b"\0" in head:
+        return True
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as error:
+        # A multi-byte character cut off at the sniff boundary is still text.
+        return error.start < len(head) - 3
+    return False
@@ -0,0 +1,346 @@
+"""Local stand-in for the K2 chat-completions API.
+
+Serves canned agent responses over keep-alive HTTP/1.1 so the backend and
+``K2Client`` can be exercised without the real API. Requests with
+``"stream": true`` get server-sent events; ``--token-delay`` paces generation
+in ``--chunk-chars`` pieces for both modes, and ``--error-rate`` answers that
+fraction of requests with a retryable 503:
+
+    python -m backend.fake_k2 serve --port 8787 --latency 0.25 --token-delay 0.01 --error-rate 0.05
+    K2_API_URL=http://127.0.0.1:8787/v1/chat/completions K2_API_KEY=local uvicorn backend.main:app
+
+``bench`` starts a server in-process and measures client throughput:
+
+    python -m backend.fake_k2 bench --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any
+from urllib.request import Request, urlopen
+
+from backend.k2_client import K2Client
+
+CANNED_OUTPUTS: dict[str, dict[str, Any]] = {
+    "Cartographer": {
+        "global_state_map": {"src/state/store.js": ["balances", "refunds"]},
+        "cross_file_dependencies": [["src/payments/refund.js", "src/state/store.js"]],
+        "mutation_hotspots": ["src/state/store.js:12"],
+        "high_risk_flows": ["refund -> store.credit"],
+    },
+    "Context Injector": {
+        "inferred_business_invariants": ["Refunds never exceed the captured amount."],
+        "trust_boundaries": ["webhooks/provider.js"],
+        "asset_priorities": ["balances"],
+        "contradiction_candidates": ["src/payments/refund.js:18"],
+    },
+    "Adversary": {
+        "candidate_findings": [
+            {
+                "error_name": "Refund Exceeds Capture",
+                "explanation": "Partial refunds are not summed before crediting the balance.",
+                "location": "src/payments/refund.js:18",
+                "exploitability_proof": "Issue two refunds of 60 against a 100 capture.",
+                "recommendation": "Track refunded totals per charge and reject overflow.",
+                "confidence": 0.9,
+            },
+            {
+                "error_name": "Webhook Tenant Switch",
+                "explanation": "Unauthenticated webhooks can change the tenant used by later refunds.",
+                "location": "src/webhooks/provider.js:5",
+                "exploitability_proof": "Send tenant.switch before a refund to bypass the tenant check.",
+                "recommendation": "Verify webhook signatures and never mutate global tenant state.",
+                "confidence": 0.8,
+            },
+            {
+                "error_name": "Admin Refund Bypass",
+                "explanation": "Admins skip ownership checks for refunds across tenants.",
+                "location": "src/auth/policy.js:2",
+                "exploitability_proof": "An admin of tenant A refunds a payment of tenant B.",
+                "recommendation": "Scope admin checks to the payment tenant.",
+                "confidence": 0.6,
+            },
+        ]
+    },
+    "Roaster": {
+        "roasted_findings": [
+            {
+                "keep": True,
+                "error_name": "Refund Exceeds Capture",
+                "location": "src/payments/refund.js:18",
+                "roast_summary": "Proof is concrete and reproducible.",
+                "proof": "Two sequential refunds exceed the captured amount.",
+                "recommendation": "Track refunded totals per charge and reject overflow.",
+                "severity": "critical",
+            }
+        ]
+    },
+    "Auditor": {
+        "final_findings": [
+            {
+                "error_name": "Refund Exceeds Capture",
+                "explanation": "Partial refunds are not summed before crediting the balance.",
+                "location": "src/payments/refund.js:18",
+                "roast_summary": "Proof is concrete and reproducible.",
+                "recommendation": "Track refunded totals per charge and reject overflow.",
+            }
+        ]
+    },
+}
+
+
+def canned_content(payload: dict[str, Any]) -> str:
+    messages = payload.get("messages") or [{}]
+    system_prompt = str(messages[0].get("content", ""))
+    for agent, output in CANNED_OUTPUTS.items():
+        if agent in system_prompt:
+            return json.dumps(output)
+    return json.dumps({})
+
+
+def completion_body(payload: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl-local",
+        "object": "chat.completion",
+        "model": payload.get("model", "local"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": canned_content(payload)},
+                "finish_reason": "stop",
+            }
+        ],
+    }
+
+
+def stream_chunks(payload: dict[str, Any], chunk_chars: int) -> list[bytes]:
+    content = canned_content(payload)
+    events = []
+    for start in range(0, len(content), chunk_chars):
+        delta = {"choices": [{"index": 0, "delta": {"content": content[start : start + chunk_chars]}}]}
+        events.append(f"data: {json.dumps(delta)}\n\n".encode("utf-8"))
+    events.append(b'data: {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}\n\n')
+    events.append(b"data: [DONE]\n\n")
+    return events
+
+
+class FakeK2Server:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        token_delay: float = 0.0,
+        chunk_chars: int = 16,
+        error_rate: float = 0.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.requests_served = 0
+        self.errors_served = 0
+        self.connections_opened = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1/chat/completions"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections_opened += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers: dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                raw = await reader.readexactly(int(headers.get("content-length", "0")))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    payload = json.loads(raw or b"{}")
+                except json.JSONDecodeError:
+                    payload = {}
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if self.error_rate and random.random() < self.error_rate:
+                    body = b'{"error": {"message": "Simulated overload."}}'
+                    writer.write(
+                        (
+                            "HTTP/1.1 503 Service Unavailable\r\n"
+                            "Content-Type: application/json\r\n"
+                            f"Content-Length: {len(body)}\r\n"
+                            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                        ).encode("latin-1")
+                        + body
+                    )
+                    await writer.drain()
+                    self.errors_served += 1
+                    if not keep_alive:
+                        break
+                    continue
+
+                if payload.get("stream"):
+                    await self._stream(writer, payload, keep_alive)
+                    self.requests_served += 1
+                    if not keep_alive:
+                        break
+                    continue
+
+                if self.token_delay:
+                    chunks = -(-len(canned_content(payload)) // self.chunk_chars)
+                    await asyncio.sleep(self.token_delay * chunks)
+                body = json.dumps(completion_body(payload)).encode("utf-8")
+                writer.write(
+                    (
+                        "HTTP/1.1 200 OK\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+                self.requests_served += 1
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer: asyncio.StreamWriter, payload: dict[str, Any], keep_alive: bool) -> None:
+        writer.write(
+            (
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: text/event-stream\r\n"
+                "Cache-Control: no-cache\r\n"
+                "Transfer-Encoding: chunked\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            ).encode("latin-1")
+        )
+        for event in stream_chunks(payload, self.chunk_chars):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def serve(
+    host: str, port: int, latency: float, token_delay: float, chunk_chars: int, error_rate: float
+) -> None:
+    server = FakeK2Server(host, port, latency, token_delay, chunk_chars, error_rate)
+    await server.start()
+    print(f"Fake K2 listening on {server.url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def _urlopen_call(url: str, payload: dict[str, Any]) -> dict[str, Any]:
+    request = Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        method="POST",
+        headers={"Authorization": "Bearer local", "Content-Type": "application/json"},
+    )
+    with urlopen(request, timeout=120) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+async def bench(requests: int, concurrency: int, latency: float, baseline: bool) -> None:
+    server = FakeK2Server(latency=latency)
+    await server.start()
+    payload = {
+        "model": "local",
+        "messages": [
+            {"role": "system", "content": "You are The Cartographer."},
+            {"role": "user", "content": "x" * 4096},
+        ],
+    }
+
+    try:
+        client = K2Client(server.url, max_concurrency=concurrency, pool_size=concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(client.chat_completion(payload, "local", "bench") for _ in range(requests))
+        )
+        elapsed = time.perf_counter() - started
+        await client.aclose()
+        print(
+            f"K2Client: {requests} requests in {elapsed:.2f}s "
+            f"({requests / elapsed:.1f} req/s, {server.connections_opened} connections)"
+        )
+
+        if baseline:
+            opened = server.connections_opened
+            limiter = asyncio.Semaphore(concurrency)
+
+            async def legacy_call() -> None:
+                async with limiter:
+                    await asyncio.to_thread(_urlopen_call, server.url, payload)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(legacy_call() for _ in range(requests)))
+            elapsed = time.perf_counter() - started
+            print(
+                f"urlopen:  {requests} requests in {elapsed:.2f}s "
+                f"({requests / elapsed:.1f} req/s, {server.connections_opened - opened} connections)"
+            )
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the K2 chat-completions API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the fake API server.")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8787)
+    serve_parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    serve_parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds per generated chunk.")
+    serve_parser.add_argument("--chunk-chars", type=int, default=16, help="Characters per generated chunk.")
+    serve_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+
+    bench_parser = commands.add_parser("bench", help="Measure K2Client throughput against an in-process server.")
+    bench_parser.add_argument("--requests", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=16)
+    bench_parser.add_argument("--latency", type=float, default=0.05)
+    bench_parser.add_argument("--no-baseline", action="store_true", help="Skip the per-call urlopen comparison.")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.latency, args.token_delay, args.chunk_chars, args.error_rate))
+    else:
+        asyncio.run(bench(args.requests, args.concurrency, args.latency, not args.no_baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""Rule engine behind the local heuristic fallback.
+
+Rules are loaded from a JSON rule pack and compiled into one alternation, so
+each file is scanned in a single pass. Every rule has an anchor ``pattern``;
+once an anchor matches, the rules sharing it check their ``requires`` and
+``excludes`` patterns against the matched line. In JS/TS files anchors inside
+comments and string, template and regex literals are ignored, and line
+conditions are checked with comments removed.
+
+``bench`` compares the engine with the previous line-by-line scanner:
+
+    python -m backend.heuristics bench --copies 2000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Iterable, Iterator
+
+from pydantic import BaseModel, Field
+
+DEFAULT_RULE_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules", "default.json")
+
+JS_EXTENSIONS = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".mts", ".cts")
+
+# Comments, string and template literals, and anything that may be a regex
+# literal; ``_js_literals`` drops the "regex literals" that are really division.
+# Quotes left open on their line are not strings, so a stray quote cannot hide
+# the rest of the line.
+_JS_TOKEN_PATTERN = re.compile(
+    r"//[^\n]*"
+    r"|/\*.*?(?:\*/|\Z)"
+    r"|(?P<regex>/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/)"
+    r"|'(?:\\.|[^'\\\n])*'"
+    r'|"(?:\\.|[^"\\\n])*"'
+    r"|`(?:\\.|[^`\\])*`?",
+    re.DOTALL,
+)
+# Words after which a "/" starts a regex literal rather than dividing.
+_JS_REGEX_KEYWORDS = frozenset(
+    ("return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do", "else", "yield", "await")
+)
+
+
+class Rule(BaseModel):
+    id: str = Field(..., min_length=1)
+    error_name: str
+    explanation: str
+    roast_summary: str
+    recommendation: str
+    pattern: str = Field(..., min_length=1)
+    requires: list[str] = Field(default_factory=list)
+    excludes: list[str] = Field(default_factory=list)
+    extensions: list[str] = Field(default_factory=list)
+
+
+class RulePack(BaseModel):
+    name: str = "custom"
+    rules: list[Rule] = Field(..., min_length=1)
+
+
+def load_rule_pack(path: str) -> RulePack:
+    with open(path, encoding="utf-8") as handle:
+        return RulePack.model_validate(json.load(handle))
+
+
+def strip_js_comments(line: str) -> str:
+    kept = []
+    position = 0
+    for token in _js_literals(line):
+        if token.group().startswith(("//", "/*")):
+            kept.append(line[position : token.start()])
+            position = token.end()
+    kept.append(line[position:])
+    return "".join(kept)
+
+
+def _js_literals(text: str) -> Iterator[re.Match[str]]:
+    """Yield the comments and string, template and regex literals of JS source in order."""
+    position = 0
+    while (token := _JS_TOKEN_PATTERN.search(text, position)) is not None:
+        if token.lastgroup == "regex" and _divides(text, token.start()):
+            position = token.start() + 1
+            continue
+        yield token
+        position = token.end()
+
+
+def _divides(text: str, slash: int) -> bool:
+    """Whether the "/" at ``slash`` follows an operand, making it division."""
+    end = slash
+    while end > 0 and text[end - 1].isspace():
+        end -= 1
+    if end == 0:
+        return False
+    if text[end - 1] in ")]":
+        return True
+    start = end
+    while start > 0 and (text[start - 1].isalnum() or text[start - 1] in "_$"):
+        start -= 1
+    return start < end and text[start:end] not in _JS_REGEX_KEYWORDS
+
+
+_CompiledRule = tuple[str, tuple[str, ...] | None, re.Pattern[str] | None, re.Pattern[str] | None]
+
+
+class RuleEngine:
+    """Single-pass matcher over a rule pack.
+
+    ``scan`` returns ``(line, rule_id)`` hits for one file, ordered by line and
+    then by rule order in the pack. With ``workers`` above one, ``scan_files``
+    fans large workspaces out to a process pool, created on first use and
+    released by ``close``. Pickling chunks to the workers costs more than the
+    scan itself unless there are idle cores, so the pool is opt-in.
+    """
+
+    def __init__(self, rules: list[Rule], *, workers: int = 1, parallel_bytes: int = 4 * 1024 * 1024) -> None:
+        self.rules = rules
+        self.workers = workers
+        self.parallel_bytes = parallel_bytes
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+
+        # Line conditions are folded into one lookahead chain (requires) and one
+        # alternation (excludes) per rule.
+        anchors: dict[str, int] = {}
+        self._anchor_rules: list[list[_CompiledRule]] = []
+        for rule in rules:
+            if rule.pattern not in anchors:
+                anchors[rule.pattern] = len(anchors)
+                self._anchor_rules.append([])
+            self._anchor_rules[anchors[rule.pattern]].append(
+                (
+                    rule.id,
+                    tuple(extension.lower() for extension in rule.extensions) or None,
+                    re.compile("".join(f"(?=.*?(?:{pattern}))" for pattern in rule.requires))
+                    if rule.requires
+                    else None,
+                    re.compile("|".join(f"(?:{pattern})" for pattern in rule.excludes)) if rule.excludes else None,
+                )
+            )
+        self._order = {rule.id: position for position, rule in enumerate(rules)}
+        self._matcher = re.compile(
+            "|".join(f"(?P<a{position}>{pattern})" for pattern, position in anchors.items()),
+            re.MULTILINE,
+        )
+
+    @classmethod
+    def from_pack(cls, path: str, **options: Any) -> "RuleEngine":
+        return cls(load_rule_pack(path).rules, **options)
+
+    def scan(self, path: str, content: str) -> list[tuple[int, str]]:
+        if self._matcher.search(content) is None:
+            return []
+        lowered = path.lower()
+        is_js = lowered.endswith(JS_EXTENSIONS)
+
+        # Without block comments or template literals every JS token ends on its
+        # own line, so only lines with an anchor match need tokenizing.
+        token_starts: list[int] | None = None
+        token_ends: list[int] = []
+        if is_js and ("/*" in content or "`" in content):
+            token_starts = []
+            for token in _js_literals(content):
+                token_starts.append(token.start())
+                token_ends.append(token.end())
+
+        hits: list[tuple[int, str]] = []
+        seen: set[tuple[int, str]] = set()
+        line = 1
+        counted = 0
+        for match in self._matcher.finditer(content):
+            position = match.start()
+            line_start = content.rfind("\n", 0, position) + 1
+            line_end = content.find("\n", position)
+            line_text = content[line_start : line_end if line_end >= 0 else len(content)]
+            if is_js:
+                if token_starts is not None:
+                    index = bisect_right(token_starts, position) - 1
+                    skipped = index >= 0 and position < token_ends[index]
+                else:
+                    offset = position - line_start
+                    skipped = False
+                    for token in _js_literals(line_text):
+                        if token.start() > offset:
+                            break
+                        if token.end() > offset:
+                            skipped = True
+                            break
+                if skipped:
+                    continue
+                if "/" in line_text:
+                    line_text = strip_js_comments(line_text)
+
+            line += content.count("\n", counted, position)
+            counted = position
+            for rule_id, extensions, requires, excludes in self._anchor_rules[int(match.lastgroup[1:])]:
+                if extensions is not None and not lowered.endswith(extensions):
+                    continue
+                if requires is not None and requires.match(line_text) is None:
+                    continue
+                if excludes is not None and excludes.search(line_text) is not None:
+                    continue
+                hit = (line, rule_id)
+                if hit not in seen:
+                    seen.add(hit)
+                    hits.append(hit)
+        if len(self._anchor_rules) > 1:
+            hits.sort(key=lambda hit: (hit[0], self._order[hit[1]]))
+        return hits
+
+    def scan_files(self, files: Iterable[tuple[str, str]]) -> list[tuple[str, int, str]]:
+        """Scan ``(path, content)`` pairs, reading them lazily and in order.
+
+        Input is consumed chunk by chunk, so only a bounded number of chunks are
+        held at once; the pool is only used once the input passes
+        ``parallel_bytes``.
+        """
+        chunk_bytes = max(self.parallel_bytes // max(self.workers * 4, 1), 64 * 1024)
+        chunks = _chunks(files, chunk_bytes)
+        results: list[tuple[str, int, str]] = []
+        pending: deque[Future[list[tuple[str, int, str]]]] = deque()
+        scanned = 0
+        for chunk in chunks:
+            scanned += sum(len(content) for _, content in chunk)
+            if self.workers <= 1 or (not pending and scanned < self.parallel_bytes):
+                results.extend(_scan_with(self, chunk))
+                continue
+            pending.append(self._get_pool().submit(_scan_chunk, chunk))
+            if len(pending) >= self.workers * 2:
+                results.extend(pending.popleft().result())
+        while pending:
+            results.extend(pending.popleft().result())
+        return results
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Scans run in worker threads, so two of them may ask for the pool at once.
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=([rule.model_dump() for rule in self.rules],),
+                )
+            return self._pool
+
+
+_worker_engine: RuleEngine | None = None
+
+
+def _init_worker(rules: list[dict[str, Any]]) -> None:
+    global _worker_engine
+    _worker_engine = RuleEngine([Rule.model_validate(rule) for rule in rules])
+
+
+def _scan_chunk(files: list[tuple[str, str]]) -> list[tuple[str, int, str]]:
+    assert _worker_engine is not None
+    return _scan_with(_worker_engine, files)
+
+
+def _scan_with(engine: RuleEngine, files: list[tuple[str, str]]) -> list[tuple[str, int, str]]:
+    return [(path, line, rule_id) for path, content in files for line, rule_id in engine.scan(path, content)]
+
+
+def _chunks(files: Iterable[tuple[str, str]], chunk_bytes: int) -> Iterator[list[tuple[str, str]]]:
+    """Group files into contiguous chunks of roughly ``chunk_bytes``, keeping file order."""
+    chunk: list[tuple[str, str]] = []
+    size = 0
+    for file in files:
+        chunk.append(file)
+        size += len(file[1])
+        if size >= chunk_bytes:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+
+def _legacy_scan(files: list[tuple[str, str]]) -> list[tuple[str, int, str]]:
+    hits: dict[tuple[str, int, str], None] = {}
+    for path, content in files:
+        for index, line in enumerate(content.splitlines()):
+            if "return true" in line and "if" not in line:
+                hits[(path, index + 1, "unconditional-success")] = None
+            if "admin" in line and "return true" in line:
+                hits[(path, index + 1, "role-shortcut")] = None
+    return list(hits)
+
+
+def _synthetic_workspace(copies: int) -> list[tuple[str, str]]:
+    """Copies of the buggy-fintech playground mixed with the frontend sources as clean files."""
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    seed = []
+    for root in (os.path.join(repo_root, "playgrounds", "buggy-fintech"), os.path.join(repo_root, "src")):
+        for directory, _, names in os.walk(root):
+            for name in sorted(names):
+                full_path = os.path.join(directory, name)
+                with open(full_path, encoding="utf-8") as handle:
+                    seed.append((os.path.relpath(full_path, repo_root), handle.read()))
+    return [(f"copy_{copy}/{path}", content) for copy in range(copies) for path, content in seed]
+
+
+def bench(copies: int, workers: int, rule_pack: str) -> None:
+    files = _synthetic_workspace(copies)
+    size = sum(len(content) for _, content in files)
+    print(f"Workspace: {len(files)} files, {size / 1024 / 1024:.1f} MiB")
+
+    def report(label: str, scan: Any) -> list[tuple[str, int, str]]:
+        started = time.perf_counter()
+        hits = scan(files)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<18} {elapsed:6.3f}s  {len(files) / elapsed:10.0f} files/s  {len(hits)} hits")
+        return hits
+
+    legacy = report("legacy", _legacy_scan)
+    single = RuleEngine.from_pack(rule_pack)
+    report("engine", single.scan_files)
+    if workers > 1:
+        pooled = RuleEngine.from_pack(rule_pack, workers=workers, parallel_bytes=0)
+        try:
+            pooled.scan_files(files[:2])
+            report(f"engine x{workers}", pooled.scan_files)
+        finally:
+            pooled.close()
+
+    differing = set(legacy).symmetric_difference(single.scan_files(files))
+    print(f"Hits differing from legacy: {len(differing)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Heuristic rule engine utilities.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench_parser = commands.add_parser("bench", help="Compare scan throughput with the line-by-line scanner.")
+    bench_parser.add_argument("--copies", type=int, default=2000, help="Copies of the seed workspace.")
+    bench_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    bench_parser.add_argument("--rules", default=DEFAULT_RULE_PACK)
+
+    args = parser.parse_args()
+    bench(args.copies, args.workers, args.rules)
+
+
+if __name__ == "__main__":
+    main()
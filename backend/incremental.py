@@ -0,0 +1,47 @@
+import json
+from typing import Any, Iterable
+
+
+def location_path(location: str) -> str:
+    path, _, line = location.rpartition(":")
+    return path if path and line.isdigit() else location
+
+
+def mentions_any(value: Any, paths: Iterable[str]) -> bool:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return any(path in text for path in paths)
+
+
+def merge_stage_output(prior: dict[str, Any], update: dict[str, Any], touched: set[str]) -> dict[str, Any]:
+    """Overlay a partial agent map onto the previous full one.
+
+    Entries of the previous map that mention a touched path are dropped, since
+    the update re-describes those files; everything else is kept as-is.
+    """
+    merged: dict[str, Any] = {}
+    for key in list(prior) + [key for key in update if key not in prior]:
+        old = prior.get(key)
+        new = update.get(key)
+        if isinstance(old, dict) and isinstance(new, dict | None):
+            kept = {name: item for name, item in old.items() if not mentions_any([name, item], touched)}
+            merged[key] = {**kept, **(new or {})}
+        elif isinstance(old, list) and isinstance(new, list | None):
+            merged[key] = [item for item in old if not mentions_any(item, touched)] + (new or [])
+        else:
+            merged[key] = new if key in update else old
+    return merged
+
+
+def merge_findings(
+    prior: list[dict[str, Any]],
+    fresh: list[dict[str, Any]],
+    reanalyzed: set[str],
+) -> list[dict[str, Any]]:
+    """Keep prior findings outside the re-analysed files and add the fresh ones."""
+    merged: dict[str, dict[str, Any]] = {}
+    for finding in prior:
+        if location_path(finding["location"]) not in reanalyzed:
+            merged[f"{finding['error_name']}:{finding['location']}"] = finding
+    for finding in fresh:
+        merged[f"{finding['error_name']}:{finding['location']}"] = finding
+    return list(merged.values())
@@ -0,0 +1,126 @@
+"""Incremental extraction of array elements from streamed agent JSON.
+
+Agents answer with one JSON object such as ``{"candidate_findings": [...]}``,
+sometimes wrapped in a code fence or preceded by prose. ``JsonArrayStream``
+is fed the text as it arrives and returns each object (or array) element of the
+named top-level array as soon as its closing bracket is seen, so later stages
+can start before the completion has finished. Elements that fail to parse are
+skipped; the complete text is still parsed with ``extract_json`` once the
+stream ends.
+"""
+
+import json
+import re
+from typing import Any
+
+_STRUCTURAL = re.compile(r'["{}\[\]:]')
+_STRING_END = re.compile(r'["\\]')
+
+
+class JsonArrayStream:
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self._buffer = ""
+        self._offset = 0  # absolute position of _buffer[0] in the stream
+        self._position = 0  # absolute position of the next character to scan
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_key: str | None = None
+        self._after_colon = False
+        self._in_array = False
+        self._element_start: int | None = None
+
+    def feed(self, text: str) -> list[Any]:
+        """Consume the next chunk and return the elements it completed."""
+        if self._finished:
+            return []
+        self._buffer += text
+        buffer = self._buffer
+        offset = self._offset
+        index = self._position - offset
+        completed: list[Any] = []
+
+        if not self._started:
+            start = buffer.find("{", index)
+            if start < 0:
+                self._discard(len(buffer))
+                return completed
+            self._started = True
+            index = start
+
+        while index < len(buffer):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                    index += 1
+                    continue
+                match = _STRING_END.search(buffer, index)
+                if match is None:
+                    index = len(buffer)
+                    break
+                index = match.end()
+                if match.group() == "\\":
+                    self._escaped = True
+                    continue
+                self._in_string = False
+                if self._depth == 1:
+                    self._last_key = buffer[self._string_start - offset + 1 : index - 1]
+                continue
+
+            match = _STRUCTURAL.search(buffer, index)
+            if match is None:
+                index = len(buffer)
+                break
+            char = match.group()
+            index = match.end()
+            if char == '"':
+                self._in_string = True
+                self._string_start = offset + match.start()
+                continue
+            if char == ":":
+                self._after_colon = self._depth == 1
+                continue
+
+            if char in "{[":
+                if self._depth == 1 and char == "[" and self._after_colon and self._last_key == self.key:
+                    self._in_array = True
+                elif self._depth == 2 and self._in_array:
+                    self._element_start = offset + match.start()
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 2 and self._element_start is not None:
+                    element = buffer[self._element_start - offset : index]
+                    self._element_start = None
+                    try:
+                        completed.append(json.loads(element))
+                    except json.JSONDecodeError:
+                        pass
+                elif self._depth == 1:
+                    self._in_array = False
+                elif self._depth <= 0:
+                    # The object is complete; ignore anything after it.
+                    self._finished = True
+                    self._buffer = ""
+                    return completed
+            if self._depth == 1:
+                self._after_colon = False
+
+        self._position = offset + index
+        # Keep only what an open string or element still needs.
+        keep_from = self._position
+        if self._element_start is not None:
+            keep_from = min(keep_from, self._element_start)
+        if self._in_string:
+            keep_from = min(keep_from, self._string_start)
+        self._discard(keep_from - offset)
+        return completed
+
+    def _discard(self, count: int) -> None:
+        self._buffer = self._buffer[count:]
+        self._offset += count
+        self._position = max(self._position, self._offset)
@@ -0,0 +1,415 @@
+import asyncio
+import json
+import random
+import ssl
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+from urllib.parse import urlsplit
+
+T = TypeVar("T")
+
+
+class K2RequestError(RuntimeError):
+    def __init__(self, message: str, *, status: int | None = None, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+        self.keep_alive = True
+
+    @property
+    def closed(self) -> bool:
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    async def request(self, head: bytes, body: bytes) -> tuple[int, dict[str, str], bytes]:
+        status, headers = await self.send(head, body)
+        return status, headers, await self.read_body(headers)
+
+    async def send(self, head: bytes, body: bytes) -> tuple[int, dict[str, str]]:
+        """Write the request and read the response status line and headers."""
+        self.writer.write(head + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed before response.")
+        parts = status_line.decode("latin-1").split(" ", 2)
+        if len(parts) < 2 or not parts[1].isdigit():
+            raise ConnectionError(f"Malformed status line: {status_line!r}")
+        status = int(parts[1])
+
+        headers: dict[str, str] = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("connection", "").lower() == "close":
+            self.keep_alive = False
+        return status, headers
+
+    async def read_body(self, headers: dict[str, str]) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_body(headers)])
+
+    async def iter_body(self, headers: dict[str, str]) -> AsyncIterator[bytes]:
+        """Yield the response body as it arrives, honouring the framing in ``headers``."""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await self.reader.readline()
+                if not size_line.endswith(b"\n"):
+                    raise asyncio.IncompleteReadError(size_line, None)
+                try:
+                    size = int(size_line.split(b";", 1)[0].strip(), 16)
+                except ValueError as error:
+                    raise ConnectionError(f"Malformed chunk size line: {size_line!r}") from error
+                if size == 0:
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                yield await self.reader.readexactly(size)
+                await self.reader.readexactly(2)
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining > 0:
+                chunk = await self.reader.read(min(remaining, 65536))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            self.keep_alive = False
+            while chunk := await self.reader.read(65536):
+                yield chunk
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class K2Client:
+    """Async HTTP/1.1 client for the K2 chat-completions API.
+
+    Keeps a pool of keep-alive connections, caps the number of in-flight
+    requests across the whole process, bounds every call by a deadline and
+    retries transient failures (network errors, 429, 5xx) with jittered
+    exponential backoff. The deadline starts once a request slot is free;
+    waiting for one is only bounded by ``acquire_timeout``, if set.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        max_concurrency: int = 8,
+        pool_size: int = 8,
+        timeout: float = 120.0,
+        connect_timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        on_retry: Callable[[str, K2RequestError], None] | None = None,
+        acquire_timeout: float | None = None,
+    ) -> None:
+        parsed = urlsplit(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Unsupported K2 API URL: {url}")
+
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        self.ssl_context = ssl.create_default_context() if parsed.scheme == "https" else None
+        default_port = 443 if parsed.scheme == "https" else 80
+        self.host_header = self.host if self.port == default_port else f"{self.host}:{self.port}"
+
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.on_retry = on_retry
+        self.acquire_timeout = acquire_timeout
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._idle: list[_Connection] = []
+        self._closed = False
+
+    async def chat_completion(
+        self,
+        payload: dict[str, Any],
+        api_key: str,
+        agent_name: str,
+    ) -> dict[str, Any]:
+        body = json.dumps(payload).encode("utf-8")
+        async with self._slot(agent_name):
+            deadline = asyncio.get_running_loop().time() + self.timeout
+            return await self._retrying(agent_name, deadline, lambda: self._attempt(body, api_key, agent_name))
+
+    async def stream_chat_completion(
+        self,
+        payload: dict[str, Any],
+        api_key: str,
+        agent_name: str,
+    ) -> AsyncIterator[str]:
+        """Yield content deltas of a ``"stream": true`` completion as they arrive.
+
+        Failures before the first byte of the body are retried like
+        ``chat_completion``; once content has been yielded an error is final. A
+        server that answers with a plain JSON completion yields its content once.
+        """
+        body = json.dumps({**payload, "stream": True}).encode("utf-8")
+
+        async with self._slot(agent_name):
+            deadline = asyncio.get_running_loop().time() + self.timeout
+            connection, headers = await self._retrying(
+                agent_name, deadline, lambda: self._open_stream(body, api_key, agent_name)
+            )
+            try:
+                if "text/event-stream" not in headers.get("content-type", ""):
+                    raw = await _before(deadline, connection.read_body(headers), agent_name, self.timeout)
+                    self._release(connection)
+                    yield _completion_content(_parse_completion(raw, agent_name))
+                    return
+
+                pending = b""
+                finished = False
+                body_chunks = connection.iter_body(headers)
+                while True:
+                    try:
+                        chunk = await _before(deadline, anext(body_chunks), agent_name, self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    pending += chunk
+                    *lines, pending = pending.split(b"\n")
+                    for line in lines:
+                        delta, done = _sse_event(line, agent_name)
+                        finished = finished or done
+                        if delta:
+                            yield delta
+                delta, done = _sse_event(pending, agent_name)
+                if delta:
+                    yield delta
+                if not (finished or done):
+                    raise ConnectionError("event stream ended before [DONE] or a finish_reason")
+            except (ConnectionError, asyncio.IncompleteReadError, OSError) as error:
+                connection.close()
+                raise K2RequestError(f"{agent_name} stream interrupted: {error}") from error
+            except BaseException:
+                connection.close()
+                raise
+            self._release(connection)
+
+    async def aclose(self) -> None:
+        self._closed = True
+        while self._idle:
+            self._idle.pop().close()
+
+    @asynccontextmanager
+    async def _slot(self, agent_name: str) -> AsyncIterator[None]:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError as error:
+            raise K2RequestError(
+                f"{agent_name} waited {self.acquire_timeout:g}s for a free K2 request slot."
+            ) from error
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _retrying(self, agent_name: str, deadline: float, attempt_call: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise K2RequestError(f"{agent_name} timed out after {self.timeout:.0f}s.")
+            try:
+                return await asyncio.wait_for(attempt_call(), timeout=remaining)
+            except asyncio.TimeoutError as error:
+                raise K2RequestError(f"{agent_name} timed out after {self.timeout:.0f}s.") from error
+            except K2RequestError as error:
+                if not error.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, error.retry_after)
+                if self.on_retry is not None:
+                    self.on_retry(agent_name, error)
+            attempt += 1
+            if loop.time() + delay >= deadline:
+                raise K2RequestError(f"{agent_name} timed out after {self.timeout:.0f}s.")
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, body: bytes, api_key: str, agent_name: str) -> dict[str, Any]:
+        connection, status, headers = await self._send(body, api_key, agent_name, "application/json")
+        try:
+            raw = await connection.read_body(headers)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as error:
+            connection.close()
+            raise K2RequestError(f"{agent_name} network error: {error}") from error
+        except BaseException:
+            connection.close()
+            raise
+
+        self._release(connection)
+        _raise_for_status(status, headers, raw, agent_name)
+        return _parse_completion(raw, agent_name)
+
+    async def _open_stream(self, body: bytes, api_key: str, agent_name: str) -> tuple[_Connection, dict[str, str]]:
+        connection, status, headers = await self._send(body, api_key, agent_name, "text/event-stream")
+        if status >= 400:
+            try:
+                raw = await connection.read_body(headers)
+            except BaseException:
+                connection.close()
+                raise
+            self._release(connection)
+            _raise_for_status(status, headers, raw, agent_name)
+        return connection, headers
+
+    async def _send(
+        self,
+        body: bytes,
+        api_key: str,
+        agent_name: str,
+        accept: str,
+    ) -> tuple[_Connection, int, dict[str, str]]:
+        head = (
+            f"POST {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host_header}\r\n"
+            f"Authorization: Bearer {api_key}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Accept: {accept}\r\n"
+            "Connection: keep-alive\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1")
+
+        connection = await self._acquire(agent_name)
+        try:
+            status, headers = await connection.send(head, body)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as error:
+            connection.close()
+            if not connection.reused:
+                raise K2RequestError(f"{agent_name} network error: {error}") from error
+            # The server dropped an idle keep-alive socket; retry once on a fresh one.
+            connection = await self._acquire(agent_name, fresh=True)
+            try:
+                status, headers = await connection.send(head, body)
+            except (ConnectionError, asyncio.IncompleteReadError, OSError) as retry_error:
+                connection.close()
+                raise K2RequestError(f"{agent_name} network error: {retry_error}") from retry_error
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+        return connection, status, headers
+
+    async def _acquire(self, agent_name: str, fresh: bool = False) -> _Connection:
+        while self._idle and not fresh:
+            connection = self._idle.pop()
+            if connection.closed:
+                connection.close()
+                continue
+            connection.reused = True
+            return connection
+
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    self.host,
+                    self.port,
+                    ssl=self.ssl_context,
+                    server_hostname=self.host if self.ssl_context else None,
+                ),
+                timeout=self.connect_timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as error:
+            raise K2RequestError(f"{agent_name} network error: {error}") from error
+        return _Connection(reader, writer)
+
+    def _release(self, connection: _Connection) -> None:
+        if self._closed or not connection.keep_alive or connection.closed or len(self._idle) >= self.pool_size:
+            connection.close()
+            return
+        self._idle.append(connection)
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        ceiling = min(self.backoff_max, self.backoff_base * (2**attempt))
+        return random.uniform(0, ceiling)
+
+
+async def _before(deadline: float, awaitable: Awaitable[T], agent_name: str, timeout: float) -> T:
+    remaining = deadline - asyncio.get_running_loop().time()
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(remaining, 0))
+    except asyncio.TimeoutError as error:
+        raise K2RequestError(f"{agent_name} timed out after {timeout:.0f}s.") from error
+
+
+def _raise_for_status(status: int, headers: dict[str, str], raw: bytes, agent_name: str) -> None:
+    if status >= 400:
+        detail = raw.decode("utf-8", errors="ignore")
+        raise K2RequestError(
+            f"{agent_name} HTTP {status}: {detail}",
+            status=status,
+            retry_after=_parse_retry_after(headers.get("retry-after")),
+        )
+
+
+def _parse_completion(raw: bytes, agent_name: str) -> dict[str, Any]:
+    try:
+        parsed = json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise K2RequestError(f"{agent_name} returned malformed JSON payload.", status=200) from error
+    if not isinstance(parsed, dict):
+        raise K2RequestError(f"{agent_name} returned malformed JSON payload.", status=200)
+    return parsed
+
+
+def _completion_content(body: dict[str, Any]) -> str:
+    choices = body.get("choices") or [{}]
+    content = (choices[0].get("message") or {}).get("content")
+    return content if isinstance(content, str) else ""
+
+
+def _sse_event(line: bytes, agent_name: str) -> tuple[str, bool]:
+    """Return the content delta carried by one SSE ``data:`` line and whether it ends the stream."""
+    line = line.strip()
+    if not line.startswith(b"data:"):
+        return "", False
+    data = line[5:].strip()
+    if data == b"[DONE]":
+        return "", True
+    try:
+        event = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise K2RequestError(f"{agent_name} sent a malformed stream event.", status=200) from error
+    choices = event.get("choices") if isinstance(event, dict) else None
+    if not choices or not isinstance(choices[0], dict):
+        return "", False
+    content = (choices[0].get("delta") or {}).get("content")
+    return content if isinstance(content, str) else "", choices[0].get("finish_reason") is not None
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
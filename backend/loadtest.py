@@ -0,0 +1,395 @@
+"""Offline load benchmark for the FastAPI backend.
+
+Each case starts the fake K2 server and a fresh uvicorn backend (with an empty
+agent cache) as subprocesses, then drives one endpoint at a fixed concurrency
+with synthetic workspaces built from ``playgrounds/buggy-fintech``. Every
+request gets a unique workspace, so the scheduler's deduplication and the agent
+cache never short-circuit the pipeline. Reported per case: throughput, p50/p99
+latency, p50/p99 time to first event and the backend's peak RSS.
+
+    python -m backend.loadtest run --scenario repo --files 10,100,1000,10000 --concurrency 8 --save base.json
+    python -m backend.loadtest run --scenario repo --files 10,100,1000,10000 --concurrency 8 --baseline base.json
+    python -m backend.loadtest compare base.json new.json
+
+``--url`` drives an already running backend instead; peak memory is then not
+reported.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, NamedTuple
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_ROOT = os.path.join(REPO_ROOT, "playgrounds", "buggy-fintech")
+
+# Metrics where a lower value is better; everything else (throughput) is higher-is-better.
+LOWER_IS_BETTER = (
+    "latency_p50_ms",
+    "latency_p99_ms",
+    "first_event_p50_ms",
+    "first_event_p99_ms",
+    "peak_rss_mib",
+    "failed",
+)
+
+
+def load_seed() -> tuple[list[tuple[str, str]], list[tuple[str, str]]]:
+    """Return the playground's ``(docs, sources)`` as ``(path, content)`` pairs."""
+    docs: list[tuple[str, str]] = []
+    sources: list[tuple[str, str]] = []
+    for directory, _, names in sorted(os.walk(SEED_ROOT)):
+        for name in sorted(names):
+            full_path = os.path.join(directory, name)
+            with open(full_path, encoding="utf-8") as handle:
+                entry = (os.path.relpath(full_path, SEED_ROOT).replace(os.sep, "/"), handle.read())
+            (docs if name.endswith(".md") else sources).append(entry)
+    return docs, sources
+
+
+def synthetic_workspace(file_count: int, salt: str = "") -> list[dict[str, str]]:
+    """Build a workspace of ``file_count`` files from copies of the playground.
+
+    Sources are copied into ``packages/pkgNNNN/`` so relative imports still
+    resolve within each copy; the docs appear once at the root. ``salt`` is
+    written into every file to make the workspace unique.
+    """
+    docs, sources = load_seed()
+    files = [{"path": path, "content": content} for path, content in docs][:file_count]
+    package = 0
+    while len(files) < file_count:
+        for path, content in sources:
+            if len(files) == file_count:
+                break
+            files.append(
+                {
+                    "path": f"packages/pkg{package:04d}/{path}",
+                    "content": f"{content}\n// pkg{package:04d} {salt}\n",
+                }
+            )
+        package += 1
+    return files
+
+
+class Sample(NamedTuple):
+    status: int
+    latency: float
+    first_event: float
+    events: int
+    failed: bool
+
+
+class Driver:
+    """Thread-per-connection HTTP driver; each worker keeps one keep-alive connection."""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        parsed = urlsplit(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def post(self, path: str, body: bytes, stream: bool) -> Sample:
+        connection = self._connection()
+        started = time.perf_counter()
+        try:
+            connection.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            first_event = 0.0
+            events = 0
+            failed = response.status != 200
+            if stream and not failed:
+                while line := response.readline():
+                    if not line.strip():
+                        continue
+                    if not events:
+                        first_event = time.perf_counter() - started
+                    events += 1
+                    if json.loads(line).get("type") == "error":
+                        failed = True
+            else:
+                response.read()
+                first_event = time.perf_counter() - started
+                events = 1
+            return Sample(response.status, time.perf_counter() - started, first_event, events, failed)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            elapsed = time.perf_counter() - started
+            return Sample(0, elapsed, elapsed, 0, True)
+
+
+def request_bodies(scenario: str, file_count: int, requests: int) -> Iterator[tuple[str, bytes, bool]]:
+    run_salt = uuid.uuid4().hex[:8]
+    if scenario == "analyze":
+        _, sources = load_seed()
+        for index in range(requests):
+            source = sources[index % len(sources)][1]
+            yield "/api/analyze", json.dumps({"source_code": f"{source}\n// {run_salt}-{index}\n"}).encode(), False
+        return
+
+    base = synthetic_workspace(file_count, run_salt)
+    for index in range(requests):
+        files = list(base)
+        files[-1] = {**files[-1], "content": f"{files[-1]['content']}// request {index}\n"}
+        body = {"workspace_name": f"bench-{file_count}", "files": files}
+        yield "/api/audit/repo/stream", json.dumps(body).encode(), True
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def drive(url: str, scenario: str, file_count: int, concurrency: int, requests: int, timeout: float) -> dict[str, Any]:
+    driver = Driver(url, timeout)
+    bodies = list(request_bodies(scenario, file_count, requests))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda request: driver.post(*request), bodies))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [sample for sample in samples if not sample.failed]
+    latencies = [sample.latency * 1000 for sample in succeeded]
+    first_events = [sample.first_event * 1000 for sample in succeeded]
+    statuses: dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+    return {
+        "scenario": scenario,
+        "files": file_count if scenario == "repo" else 1,
+        "concurrency": concurrency,
+        "requests": requests,
+        "failed": len(samples) - len(succeeded),
+        "statuses": statuses,
+        "throughput_rps": round(len(succeeded) / elapsed, 3) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.5), 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99), 1),
+        "first_event_p50_ms": round(percentile(first_events, 0.5), 1),
+        "first_event_p99_ms": round(percentile(first_events, 0.99), 1),
+        "events_per_request": round(sum(sample.events for sample in succeeded) / len(succeeded), 1)
+        if succeeded
+        else 0.0,
+        "wall_seconds": round(elapsed, 3),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def peak_rss_mib(pid: int) -> float | None:
+    """High-water mark of the process's resident memory, from ``/proc`` (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def wait_until_ready(url: str, process: subprocess.Popen[bytes], timeout: float = 30.0) -> None:
+    parsed = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode} before becoming ready.")
+        connection = http.client.HTTPConnection(parsed.hostname or "127.0.0.1", parsed.port or 80, timeout=1)
+        try:
+            connection.request("GET", parsed.path or "/")
+            if connection.getresponse().status < 500:
+                return
+        except OSError:
+            time.sleep(0.1)
+        finally:
+            connection.close()
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s.")
+
+
+class Stack:
+    """Fake K2 plus a backend on free ports, with a throwaway database."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.processes: list[subprocess.Popen[bytes]] = []
+        self.backend: subprocess.Popen[bytes] | None = None
+        self._directory = tempfile.TemporaryDirectory(prefix="invariant-loadtest-")
+
+    def __enter__(self) -> "Stack":
+        args = self.args
+        k2_port = free_port()
+        command = [sys.executable, "-m", "backend.fake_k2", "serve", "--port", str(k2_port)]
+        command += ["--latency", str(args.latency), "--token-delay", str(args.token_delay)]
+        command += ["--chunk-chars", str(args.chunk_chars), "--error-rate", str(args.error_rate)]
+        fake = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+        self.processes.append(fake)
+        wait_until_ready(f"http://127.0.0.1:{k2_port}/", fake)
+
+        self.port = free_port()
+        environment = {
+            **os.environ,
+            "K2_API_URL": f"http://127.0.0.1:{k2_port}/v1/chat/completions",
+            "K2_API_KEY": "" if args.heuristic else "local",
+            "K2_STREAMING": "0" if args.no_stream else "1",
+            "INVARIANT_DB_PATH": os.path.join(self._directory.name, "invariant.sqlite3"),
+        }
+        self.backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=REPO_ROOT,
+            env=environment,
+        )
+        self.processes.append(self.backend)
+        wait_until_ready(self.url + "/health", self.backend)
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __exit__(self, *_: Any) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self._directory.cleanup()
+
+
+def run(args: argparse.Namespace) -> int:
+    sizes = [int(size) for size in args.files.split(",")] if args.scenario == "repo" else [1]
+    results = []
+    for file_count in sizes:
+        requests = args.requests or args.concurrency * 2
+        if args.url:
+            result = drive(args.url, args.scenario, file_count, args.concurrency, requests, args.timeout)
+            result["peak_rss_mib"] = None
+        else:
+            with Stack(args) as stack:
+                result = drive(stack.url, args.scenario, file_count, args.concurrency, requests, args.timeout)
+                assert stack.backend is not None
+                result["peak_rss_mib"] = peak_rss_mib(stack.backend.pid)
+        results.append(result)
+        print(format_result(result), flush=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            key: getattr(args, key)
+            for key in ("scenario", "concurrency", "latency", "token_delay", "chunk_chars", "error_rate")
+        }
+        | {"streaming": not args.no_stream, "heuristic": args.heuristic},
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+            handle.write("\n")
+        print(f"Saved {args.save}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            return compare(json.load(handle), report, args.tolerance)
+    return 0
+
+
+def format_result(result: dict[str, Any]) -> str:
+    memory = "-" if result["peak_rss_mib"] is None else f"{result['peak_rss_mib']:.0f} MiB"
+    return (
+        f"{result['scenario']:<8} files={result['files']:<6} c={result['concurrency']:<3} "
+        f"{result['throughput_rps']:8.2f} req/s  "
+        f"p50 {result['latency_p50_ms']:8.1f} ms  p99 {result['latency_p99_ms']:8.1f} ms  "
+        f"first event p50 {result['first_event_p50_ms']:7.1f} ms  p99 {result['first_event_p99_ms']:7.1f} ms  "
+        f"rss {memory}  failed {result['failed']}/{result['requests']}"
+    )
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float) -> int:
+    """Print each metric's change against the baseline; return 1 if any regressed past ``tolerance``."""
+    previous = {(result["scenario"], result["files"], result["concurrency"]): result for result in baseline["results"]}
+    old_config, new_config = baseline.get("config", {}), current.get("config", {})
+    for key in sorted(set(old_config) | set(new_config)):
+        if old_config.get(key) != new_config.get(key):
+            print(f"Warning: {key} differs from the baseline ({old_config.get(key)} -> {new_config.get(key)}).")
+    regressions = 0
+    for result in current["results"]:
+        key = (result["scenario"], result["files"], result["concurrency"])
+        before = previous.get(key)
+        if before is None:
+            print(f"{key[0]} files={key[1]} c={key[2]}: no baseline")
+            continue
+        changes = []
+        for metric in ("throughput_rps", *LOWER_IS_BETTER):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if metric == "failed":
+                worse = new > old
+            regressions += worse
+            changes.append(f"{metric} {old:g} -> {new:g} ({change:+.0%}){' REGRESSION' if worse else ''}")
+        print(f"{key[0]} files={key[1]} c={key[2]}:\n  " + "\n  ".join(changes))
+    print(f"{regressions} regression(s) beyond {tolerance:.0%}.")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the backend.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmark one scenario over one or more workspace sizes.")
+    run_parser.add_argument("--scenario", choices=("repo", "analyze"), default="repo")
+    run_parser.add_argument("--files", default="10,100,1000", help="Comma-separated workspace sizes (repo only).")
+    run_parser.add_argument("--concurrency", type=int, default=4)
+    run_parser.add_argument("--requests", type=int, default=0, help="Requests per case (default: 2x concurrency).")
+    run_parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout in seconds.")
+    run_parser.add_argument("--latency", type=float, default=0.2, help="Fake K2 seconds before each response.")
+    run_parser.add_argument("--token-delay", type=float, default=0.005, help="Fake K2 seconds per generated chunk.")
+    run_parser.add_argument("--chunk-chars", type=int, default=16)
+    run_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake K2 calls that fail.")
+    run_parser.add_argument("--no-stream", action="store_true", help="Run the backend with K2_STREAMING=0.")
+    run_parser.add_argument("--heuristic", action="store_true", help="Run without a K2 key (local rules only).")
+    run_parser.add_argument("--url", help="Drive an already running backend instead of starting one.")
+    run_parser.add_argument("--save", help="Write the results to this JSON file.")
+    run_parser.add_argument("--baseline", help="Compare against a saved results file; exit 1 on regression.")
+    run_parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative change (default 10%%).")
+
+    compare_parser = commands.add_parser("compare", help="Diff two saved results files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        sys.exit(run(args))
+    with open(args.baseline, encoding="utf-8") as old, open(args.current, encoding="utf-8") as new:
+        sys.exit(compare(json.load(old), json.load(new), args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1506 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from collections.abc import Mapping
+from contextlib import AbstractContextManager, aclosing, asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from backend.archive import ArchiveError, ArchiveLimits, ArchiveWorkspace, spool_multipart
+from backend.heuristics import DEFAULT_RULE_PACK, RuleEngine
+from backend.incremental import merge_findings, merge_stage_output
+from backend.json_stream import JsonArrayStream
+from backend.k2_client import K2Client, K2RequestError
+from backend.repo_index import (
+    RepoIndex,
+    build_import_graph,
+    build_repo_index,
+    dependents,
+    estimate_tokens,
+    plan_shards,
+    priority_order,
+    render_context,
+)
+from backend.scheduler import Job, JobScheduler, Priority, SchedulerBusy
+from backend.store import DEFAULT_DB_PATH, AgentCache, ResultStore, content_hash, files_digest, open_database
+from backend.telemetry import (
+    AGENT_BYTES_TOTAL,
+    AGENT_CACHE_TOTAL,
+    AGENT_ERRORS_TOTAL,
+    AGENT_FIRST_TOKEN_SECONDS,
+    AGENT_RETRIES_TOTAL,
+    AGENT_SECONDS,
+    AGENT_TOKENS_TOTAL,
+    JOB_QUEUE_SECONDS,
+    JOB_SECONDS,
+    PARSE_SECONDS,
+    REGISTRY,
+    STAGE_SECONDS,
+    Gauge,
+    Trace,
+    current_trace,
+    span,
+)
+
+K2_API_URL = os.getenv("K2_API_URL", "https://api.k2think.ai/v1/chat/completions")
+K2_MODEL = "MBZUAI-IFM/K2-Think-v2"
+K2_MAX_CONCURRENCY = int(os.getenv("K2_MAX_CONCURRENCY", "8"))
+K2_TIMEOUT_SECONDS = float(os.getenv("K2_TIMEOUT_SECONDS", "120"))
+K2_MAX_RETRIES = int(os.getenv("K2_MAX_RETRIES", "3"))
+K2_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv("K2_ACQUIRE_TIMEOUT_SECONDS", "0")) or None
+K2_STREAMING = os.getenv("K2_STREAMING", "1") != "0"
+AGENT_PROGRESS_SECONDS = float(os.getenv("AGENT_PROGRESS_SECONDS", "1.0"))
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "24000"))
+ADVERSARY_SHARD_TOKENS = int(os.getenv("ADVERSARY_SHARD_TOKENS", "16000"))
+ADVERSARY_MAX_CANDIDATES = int(os.getenv("ADVERSARY_MAX_CANDIDATES", "40"))
+
+HEURISTIC_RULE_PACK = os.getenv("HEURISTIC_RULE_PACK", DEFAULT_RULE_PACK)
+# The process pool only pays off on hosts with spare cores; measure with
+# `python -m backend.heuristics bench --workers N` before raising this.
+HEURISTIC_WORKERS = int(os.getenv("HEURISTIC_WORKERS", "1"))
+HEURISTIC_PARALLEL_BYTES = int(os.getenv("HEURISTIC_PARALLEL_BYTES", str(4 * 1024 * 1024)))
+
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+SCHEDULER_INTERACTIVE_WORKERS = int(os.getenv("SCHEDULER_INTERACTIVE_WORKERS", "2"))
+SCHEDULER_MAX_QUEUED = int(os.getenv("SCHEDULER_MAX_QUEUED", "32"))
+
+UPLOAD_LIMITS = ArchiveLimits(
+    max_upload_bytes=int(os.getenv("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024))),
+    max_files=int(os.getenv("UPLOAD_MAX_FILES", "20000")),
+    max_file_bytes=int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(1024 * 1024))),
+    max_total_bytes=int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", str(512 * 1024 * 1024))),
+)
+
+AGENT_CACHE_MAX_BYTES = int(os.getenv("AGENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+AGENT_CACHE_TTL_SECONDS = float(os.getenv("AGENT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RUN_RETENTION_SECONDS = float(os.getenv("RUN_RETENTION_SECONDS", str(30 * 24 * 3600)))
+RUN_RETENTION_COUNT = int(os.getenv("RUN_RETENTION_COUNT", "1000"))
+
+TELEMETRY_SPANS = os.getenv("TELEMETRY_SPANS", "0") == "1"
+
+_k2_client: K2Client | None = None
+_event_sink: ContextVar[Callable[[dict[str, Any]], None] | None] = ContextVar("event_sink", default=None)
+_agent_call: ContextVar[dict[str, Any] | None] = ContextVar("agent_call", default=None)
+_database = open_database(os.getenv("INVARIANT_DB_PATH", DEFAULT_DB_PATH))
+agent_cache = AgentCache(_database, max_bytes=AGENT_CACHE_MAX_BYTES, ttl_seconds=AGENT_CACHE_TTL_SECONDS)
+result_store = ResultStore(_database, max_age_seconds=RUN_RETENTION_SECONDS, max_count=RUN_RETENTION_COUNT)
+scheduler = JobScheduler(
+    workers=SCHEDULER_WORKERS,
+    interactive_workers=SCHEDULER_INTERACTIVE_WORKERS,
+    max_queued=SCHEDULER_MAX_QUEUED,
+)
+heuristic_engine = RuleEngine.from_pack(
+    HEURISTIC_RULE_PACK,
+    workers=HEURISTIC_WORKERS,
+    parallel_bytes=HEURISTIC_PARALLEL_BYTES,
+)
+REGISTRY.register(
+    Gauge(
+        "invariant_scheduler_jobs",
+        "Scheduled jobs by state.",
+        ("state",),
+        collect=lambda: {(state,): count for state, count in scheduler.stats().items()},
+    )
+)
+
+
+class AnalyzeRequest(BaseModel):
+    source_code: str = Field(..., min_length=1)
+
+
+class RepoFile(BaseModel):
+    path: str = Field(..., min_length=1)
+    content: str
+
+
+class RepoAuditRequest(BaseModel):
+    workspace_name: str = "workspace"
+    files: list[RepoFile] = Field(..., min_length=1)
+
+
+class RepoFileChange(BaseModel):
+    path: str = Field(..., min_length=1)
+    sha256: str = Field(..., pattern=r"^[0-9a-f]{64}$")
+    content: str | None = None
+
+
+class RepoDeltaAuditRequest(BaseModel):
+    base_run_id: str = Field(..., min_length=1)
+    workspace_name: str = "workspace"
+    changed: list[RepoFileChange] = Field(default_factory=list)
+    removed: list[str] = Field(default_factory=list)
+
+
+class Finding(BaseModel):
+    error_name: str
+    explanation: str
+    location: str
+    roast_summary: str
+    recommendation: str
+
+
+class WorkspaceDelta(BaseModel):
+    base_run_id: str
+    workspace_name: str
+    files: list[RepoFile]
+    changed: list[str]
+    removed: list[str]
+    stages: dict[str, Any]
+    prior_findings: list[Finding]
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    yield
+    await scheduler.close()
+    heuristic_engine.close()
+    if _k2_client is not None:
+        await _k2_client.aclose()
+
+
+app = FastAPI(title="Invariant Backend", version="0.2.0", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "http://localhost:3000",
+        "http://127.0.0.1:3000",
+        "http://localhost:5173",
+        "http://127.0.0.1:5173",
+    ],
+    allow_origin_regex=r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$",
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/health")
+def health() -> dict[str, str]:
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    # Rendered on the event loop: the scheduler gauge reads job state that only the loop mutates.
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/api/analyze")
+async def analyze_source(request: AnalyzeRequest) -> dict[str, Any]:
+    job, _ = submit_job(
+        f"analyze:{content_hash(request.source_code)}",
+        Priority.INTERACTIVE,
+        lambda: run_analysis(request.source_code),
+    )
+    result: dict[str, Any] | None = None
+    async for event in scheduler.subscribe(job):
+        if event["type"] == "result":
+            result = event["result"]
+        elif event["type"] == "error":
+            raise HTTPException(status_code=500, detail=event["message"])
+    if result is None:
+        raise HTTPException(status_code=503, detail="Analysis was cancelled.")
+    return result
+
+
+@app.post("/api/audit/repo/stream")
+async def stream_repo_audit(request: RepoAuditRequest) -> StreamingResponse:
+    files = {file.path: file.content for file in request.files}
+    digest = await asyncio.to_thread(files_digest, files.items())
+    job, _ = submit_job(
+        f"repo:{request.workspace_name}:{digest}",
+        Priority.BATCH,
+        lambda: record_run(request.workspace_name, run_pipeline(request.workspace_name, files)),
+    )
+    return stream_events(job)
+
+
+@app.post("/api/audit/repo/archive/stream")
+async def stream_archive_audit(request: Request) -> StreamingResponse:
+    """Audit a workspace uploaded as the ``archive`` part of a multipart form (tar, tar.gz or zip)."""
+    # Refuse before spooling the body; submit_job still checks again, since the
+    # queue can fill while the upload is read.
+    if not scheduler.has_capacity(Priority.BATCH):
+        raise too_busy(SchedulerBusy(Priority.BATCH, scheduler.retry_after))
+    try:
+        upload = await spool_multipart(request.stream(), request.headers.get("content-type", ""), UPLOAD_LIMITS)
+        workspace = await asyncio.to_thread(ArchiveWorkspace, upload.file, UPLOAD_LIMITS)
+    except ArchiveError as error:
+        raise HTTPException(status_code=error.status, detail=str(error)) from error
+
+    workspace_name = upload.fields.get("workspace_name") or upload.filename or "workspace"
+
+    async def events() -> AsyncIterator[dict[str, Any]]:
+        yield log_event("Pipeline", workspace.summary())
+        async for event in run_pipeline(workspace_name, workspace):
+            yield event
+
+    try:
+        digest = await asyncio.to_thread(files_digest, workspace.items())
+        job, created = submit_job(
+            f"repo:{workspace_name}:{digest}",
+            Priority.BATCH,
+            lambda: record_run(workspace_name, events()),
+            cleanup=workspace.close,
+        )
+    except BaseException:
+        await asyncio.to_thread(workspace.close)
+        raise
+    if not created:
+        await asyncio.to_thread(workspace.close)
+    return stream_events(job)
+
+
+@app.post("/api/audit/repo/delta/stream")
+async def stream_delta_audit(request: RepoDeltaAuditRequest) -> StreamingResponse:
+    delta = await asyncio.to_thread(resolve_delta, request)
+    job, _ = submit_job(
+        f"delta:{content_hash(request.model_dump_json())}",
+        Priority.BATCH,
+        lambda: record_run(request.workspace_name, run_delta_pipeline(delta)),
+    )
+    return stream_events(job)
+
+
+@app.get("/api/results/{run_id}")
+def get_results(run_id: str) -> dict[str, Any]:
+    result = result_store.get(run_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found.")
+    return result
+
+
+def submit_job(
+    key: str,
+    priority: Priority,
+    factory: Callable[[], AsyncIterator[dict[str, Any]]],
+    cleanup: Callable[[], Any] | None = None,
+) -> tuple[Job, bool]:
+    submitted = time.perf_counter()
+    try:
+        return scheduler.submit(key, priority, lambda: traced(priority, submitted, factory()), cleanup)
+    except SchedulerBusy as error:
+        raise too_busy(error) from error
+
+
+def too_busy(error: SchedulerBusy) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(round(error.retry_after))},
+    )
+
+
+def stream_events(job: Job) -> StreamingResponse:
+    # Starlette cancels this generator when the client disconnects, which
+    # detaches the subscriber and cancels the job if it was the last one.
+    async def stream() -> AsyncIterator[str]:
+        async for event in scheduler.subscribe(job):
+            yield to_ndjson(event)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def traced(
+    priority: Priority, submitted: float, events: AsyncIterator[dict[str, Any]]
+) -> AsyncIterator[dict[str, Any]]:
+    """Time a scheduled job; with TELEMETRY_SPANS, attach the spans finished since the previous event to each event."""
+    label = priority.name.lower()
+    waited = time.perf_counter() - submitted
+    JOB_QUEUE_SECONDS.observe(waited, priority=label)
+    trace: Trace | None = None
+    if TELEMETRY_SPANS:
+        trace = Trace(submitted)
+        trace.add("queue", submitted, waited)
+        current_trace.set(trace)
+
+    with JOB_SECONDS.time(priority=label):
+        async for event in events:
+            if trace is not None and (spans := trace.drain()):
+                event = {**event, "spans": spans}
+            yield event
+
+
+async def record_run(workspace_name: str, events: AsyncIterator[dict[str, Any]]) -> AsyncIterator[dict[str, Any]]:
+    seen: list[dict[str, Any]] = []
+    async for event in events:
+        seen.append(event)
+        if event["type"] == "done":
+            await asyncio.to_thread(save_run, workspace_name, seen)
+        yield event
+
+
+async def run_analysis(source_code: str) -> AsyncIterator[dict[str, Any]]:
+    findings = await asyncio.to_thread(heuristic_findings, {"inline.ts": source_code})
+    result = {
+        "run_id": f"run_{uuid.uuid4().hex[:10]}",
+        "status": "success",
+        "summary": f"{len(findings)} high-signal issues found",
+        "issues_found": len(findings),
+        "critical_logic_failures": [finding.model_dump() for finding in findings],
+        "logs": [
+            "Mock endpoint is active for compatibility.",
+            "Use /api/audit/repo/stream for the full 5-agent pipeline.",
+        ],
+        "model": K2_MODEL,
+    }
+    await asyncio.to_thread(result_store.save, result["run_id"], result)
+    yield {"type": "result", "result": result}
+
+
+def save_run(workspace_name: str, events: list[dict[str, Any]]) -> None:
+    done = events[-1]
+    failed = any(event["type"] == "error" for event in events)
+    result_store.save(
+        done["summary"]["run_id"],
+        {
+            "run_id": done["summary"]["run_id"],
+            "status": "error" if failed else "partial" if done["summary"].get("partial") else "success",
+            "workspace_name": workspace_name,
+            "summary": done["summary"],
+            "findings": done["findings"],
+            "events": events,
+            "model": K2_MODEL,
+        },
+    )
+
+
+def partial_summary(failed_shards: list[list[str]]) -> dict[str, Any]:
+    """Summary fields marking a run whose Adversary skipped some files because their shard failed."""
+    if not failed_shards:
+        return {}
+    return {
+        "partial": True,
+        "failed_shards": len(failed_shards),
+        "unanalyzed_files": sorted(path for shard in failed_shards for path in shard),
+    }
+
+
+def resolve_delta(request: RepoDeltaAuditRequest) -> WorkspaceDelta:
+    snapshot = result_store.get_snapshot(request.base_run_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Run {request.base_run_id} has no stored workspace snapshot.")
+    manifest, stages = snapshot
+
+    contents: dict[str, str] = {}
+    for path, digest in manifest.items():
+        content = result_store.get_blob(digest)
+        if content is None:
+            raise HTTPException(status_code=410, detail=f"Stored content for {path} is no longer available.")
+        contents[path] = content
+
+    changed = []
+    for change in request.changed:
+        if change.content is None:
+            content = result_store.get_blob(change.sha256)
+            if content is None:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"No stored content for {change.path} ({change.sha256}); send the file content.",
+                )
+        elif content_hash(change.content) != change.sha256:
+            raise HTTPException(status_code=422, detail=f"Content hash mismatch for {change.path}.")
+        else:
+            content = change.content
+        if manifest.get(change.path) != change.sha256:
+            changed.append(change.path)
+        contents[change.path] = content
+
+    removed = [path for path in request.removed if path in contents]
+    for path in removed:
+        del contents[path]
+    if not contents:
+        raise HTTPException(status_code=422, detail="Delta removes every file in the workspace.")
+
+    prior = result_store.get(request.base_run_id) or {}
+    return WorkspaceDelta(
+        base_run_id=request.base_run_id,
+        workspace_name=request.workspace_name,
+        files=[RepoFile(path=path, content=content) for path, content in contents.items()],
+        changed=changed,
+        removed=removed,
+        stages=stages,
+        prior_findings=normalize_findings(prior.get("findings", [])),
+    )
+
+
+async def run_pipeline(workspace_name: str, contents: Mapping[str, str]) -> AsyncIterator[dict[str, Any]]:
+    """Run the full audit over ``contents``, which may read files lazily (see ``ArchiveWorkspace``)."""
+    run_id = f"run_{uuid.uuid4().hex[:12]}"
+    api_key = os.getenv("K2_API_KEY")
+    with stage_span("workspace"):
+        docs_context = await asyncio.to_thread(extract_docs_context, contents)
+        metadata_context = await asyncio.to_thread(extract_metadata_context, contents)
+        cache_scope = await asyncio.to_thread(files_digest, contents.items())
+
+    yield log_event(
+        "Pipeline",
+        f"Run {run_id} started. Loaded {len(contents)} files from {workspace_name}.",
+    )
+
+    if not api_key:
+        yield log_event(
+            "Pipeline",
+            "K2_API_KEY is not configured. Running local heuristic fallback.",
+        )
+        with stage_span("heuristics"):
+            findings = await asyncio.to_thread(heuristic_findings, contents)
+        with stage_span("snapshot"):
+            await asyncio.to_thread(result_store.save_snapshot, run_id, contents.items(), {})
+        for finding in findings:
+            yield {"type": "finding", "finding": finding.model_dump()}
+        yield {
+            "type": "done",
+            "summary": {"critical_count": len(findings), "run_id": run_id},
+            "findings": [finding.model_dump() for finding in findings],
+        }
+        return
+
+    try:
+        with stage_span("index"):
+            index = await asyncio.to_thread(build_repo_index, contents)
+            shards = plan_shards(index, ADVERSARY_SHARD_TOKENS)
+        yield log_event("Pipeline", f"{index.summary()} Adversary split into {len(shards)} shard(s).")
+
+        with stage_span("context"):
+            repo_context = await asyncio.to_thread(select_repo_context, index, contents, CONTEXT_TOKEN_BUDGET)
+        stage: dict[str, Any] = {}
+        async for event in stage_events("cartographer", run_cartographer(api_key, repo_context, cache_scope), stage):
+            yield event
+        cartographer, cartographer_raw = stage["value"]
+        yield log_event(
+            "Cartographer",
+            summarize_agent(
+                cartographer,
+                "Mapped repository topology and state dependencies.",
+            ),
+            cartographer_raw,
+        )
+
+        async for event in stage_events(
+            "injector",
+            run_context_injector(api_key, cartographer, docs_context, metadata_context, cache_scope), stage
+        ):
+            yield event
+        injector, injector_raw = stage["value"]
+        yield log_event(
+            "Context Injector",
+            summarize_agent(
+                injector,
+                "Inferred business intent and trust boundaries from docs/metadata.",
+            ),
+            injector_raw,
+        )
+
+        async for event in stage_events(
+            "adversary",
+            hunt_and_roast(
+                api_key,
+                cartographer,
+                injector,
+                index,
+                contents,
+                shards,
+                cache_scope,
+                "Proposed exploit candidates with cross-file attack paths.",
+            ),
+            stage,
+        ):
+            yield event
+        roaster, failed_shards = stage["value"]
+
+        # Final findings are streamed as the Auditor writes them; the loop below
+        # only emits any that the incremental parser could not pick out.
+        streamed: list[str] = []
+
+        def on_final_finding(item: Any) -> None:
+            for finding in normalize_findings([item]):
+                streamed.append(finding.model_dump_json())
+                emit({"type": "finding", "finding": finding.model_dump()})
+
+        async for event in stage_events("auditor", run_auditor(api_key, roaster, cache_scope, on_final_finding), stage):
+            yield event
+        findings, auditor_raw = stage["value"]
+        yield log_event(
+            "Auditor",
+            f"Finalized {len(findings)} critical findings for report output.",
+            auditor_raw,
+        )
+
+        with stage_span("snapshot"):
+            await asyncio.to_thread(
+                result_store.save_snapshot,
+                run_id,
+                contents.items(),
+                {"cartographer": cartographer, "injector": injector},
+            )
+
+        for finding in findings:
+            key = finding.model_dump_json()
+            if key in streamed:
+                streamed.remove(key)
+                continue
+            yield {"type": "finding", "finding": finding.model_dump()}
+
+        yield {
+            "type": "done",
+            "summary": {"critical_count": len(findings), "run_id": run_id, **partial_summary(failed_shards)},
+            "findings": [finding.model_dump() for finding in findings],
+        }
+    except Exception as error:
+        yield {"type": "error", "message": f"{type(error).__name__}: {error}"}
+        yield {
+            "type": "done",
+            "summary": {"critical_count": 0, "run_id": run_id},
+            "findings": [],
+        }
+
+
+async def run_delta_pipeline(delta: WorkspaceDelta) -> AsyncIterator[dict[str, Any]]:
+    run_id = f"run_{uuid.uuid4().hex[:12]}"
+    api_key = os.getenv("K2_API_KEY")
+    workspace = [(file.path, file.content) for file in delta.files]
+    contents = dict(workspace)
+    cache_scope = await asyncio.to_thread(files_digest, workspace)
+
+    touched = set(delta.changed) | set(delta.removed)
+    graph = await asyncio.to_thread(build_import_graph, {**contents, **{path: "" for path in delta.removed}})
+    affected = (set(delta.changed) | dependents(graph, touched)) - set(delta.removed)
+    affected_files = [file for file in delta.files if file.path in affected]
+    reanalyzed = affected | set(delta.removed)
+    prior_findings = [finding.model_dump() for finding in delta.prior_findings]
+
+    yield log_event(
+        "Pipeline",
+        f"Incremental run {run_id} against {delta.base_run_id}: {len(delta.changed)} changed, "
+        f"{len(delta.removed)} removed, {len(affected_files)} of {len(delta.files)} files to re-analyse.",
+    )
+
+    if not api_key:
+        yield log_event(
+            "Pipeline",
+            "K2_API_KEY is not configured. Running local heuristic fallback.",
+        )
+        affected_contents = {file.path: file.content for file in affected_files}
+        with stage_span("heuristics"):
+            fresh = [finding.model_dump() for finding in await asyncio.to_thread(heuristic_findings, affected_contents)]
+        findings = normalize_findings(merge_findings(prior_findings, fresh, reanalyzed))
+        with stage_span("snapshot"):
+            await asyncio.to_thread(result_store.save_snapshot, run_id, workspace, delta.stages)
+        for finding in findings:
+            yield {"type": "finding", "finding": finding.model_dump()}
+        yield {
+            "type": "done",
+            "summary": {"critical_count": len(findings), "run_id": run_id, "base_run_id": delta.base_run_id},
+            "findings": [finding.model_dump() for finding in findings],
+        }
+        return
+
+    try:
+        with stage_span("index"):
+            index = await asyncio.to_thread(build_repo_index, contents)
+
+        cartographer = delta.stages.get("cartographer")
+        source_touched = {path for path in touched if not is_doc_path(path) and not is_metadata_path(path)}
+        stage: dict[str, Any] = {}
+        if cartographer is None:
+            with stage_span("context"):
+                repo_context = await asyncio.to_thread(select_repo_context, index, contents, CONTEXT_TOKEN_BUDGET)
+            async for event in stage_events("cartographer", run_cartographer(api_key, repo_context, cache_scope), stage):
+                yield event
+            cartographer, cartographer_raw = stage["value"]
+            yield log_event(
+                "Cartographer",
+                summarize_agent(cartographer, "Mapped repository topology and state dependencies."),
+                cartographer_raw,
+            )
+        elif source_touched and affected_files:
+            with stage_span("context"):
+                affected_context = await asyncio.to_thread(
+                    render_context, index, contents, [file.path for file in affected_files], CONTEXT_TOKEN_BUDGET
+                )
+            async for event in stage_events(
+                "cartographer", run_cartographer(api_key, affected_context, cache_scope, prior=cartographer), stage
+            ):
+                yield event
+            update, cartographer_raw = stage["value"]
+            cartographer = merge_stage_output(cartographer, update, reanalyzed)
+            yield log_event(
+                "Cartographer",
+                summarize_agent(
+                    cartographer,
+                    f"Re-mapped {len(affected_files)} changed or dependent files onto the prior topology.",
+                ),
+                cartographer_raw,
+            )
+        else:
+            yield log_event("Cartographer", "Reused prior repository topology; no source files changed.")
+
+        injector = delta.stages.get("injector")
+        if injector is None or any(is_doc_path(path) or is_metadata_path(path) for path in touched):
+            with stage_span("workspace"):
+                docs_context = await asyncio.to_thread(extract_docs_context, contents)
+                metadata_context = await asyncio.to_thread(extract_metadata_context, contents)
+            async for event in stage_events(
+                "injector",
+                run_context_injector(api_key, cartographer, docs_context, metadata_context, cache_scope),
+                stage,
+            ):
+                yield event
+            injector, injector_raw = stage["value"]
+            yield log_event(
+                "Context Injector",
+                summarize_agent(
+                    injector,
+                    "Inferred business intent and trust boundaries from docs/metadata.",
+                ),
+                injector_raw,
+            )
+        else:
+            yield log_event("Context Injector", "Reused prior business invariants; docs and metadata unchanged.")
+
+        fresh: list[dict[str, Any]] = []
+        failed_shards: list[list[str]] = []
+        if affected_files:
+            shards = await asyncio.to_thread(plan_shards, index, ADVERSARY_SHARD_TOKENS, affected)
+            async for event in stage_events(
+                "adversary",
+                hunt_and_roast(
+                    api_key,
+                    cartographer,
+                    injector,
+                    index,
+                    contents,
+                    shards,
+                    cache_scope,
+                    f"Proposed exploit candidates for {len(affected_files)} changed or dependent files.",
+                ),
+                stage,
+            ):
+                yield event
+            roaster, failed_shards = stage["value"]
+
+            async for event in stage_events("auditor", run_auditor(api_key, roaster, cache_scope), stage):
+                yield event
+            audited, auditor_raw = stage["value"]
+            fresh = [finding.model_dump() for finding in audited]
+            yield log_event(
+                "Auditor",
+                f"Finalized {len(audited)} critical findings for the changed files.",
+                auditor_raw,
+            )
+        else:
+            yield log_event("Adversary", "No remaining files were affected by the delta.")
+
+        # Files whose Adversary shard failed keep their prior findings.
+        unanalyzed = {path for shard in failed_shards for path in shard}
+        findings = normalize_findings(merge_findings(prior_findings, fresh, reanalyzed - unanalyzed))
+        yield log_event(
+            "Pipeline",
+            f"Merged {len(fresh)} new findings with {len(findings) - len(fresh)} prior findings that still apply.",
+        )
+
+        with stage_span("snapshot"):
+            await asyncio.to_thread(
+                result_store.save_snapshot, run_id, workspace, {"cartographer": cartographer, "injector": injector}
+            )
+
+        for finding in findings:
+            yield {"type": "finding", "finding": finding.model_dump()}
+
+        yield {
+            "type": "done",
+            "summary": {
+                "critical_count": len(findings),
+                "run_id": run_id,
+                "base_run_id": delta.base_run_id,
+                **partial_summary(failed_shards),
+            },
+            "findings": [finding.model_dump() for finding in findings],
+        }
+    except Exception as error:
+        yield {"type": "error", "message": f"{type(error).__name__}: {error}"}
+        yield {
+            "type": "done",
+            "summary": {"critical_count": 0, "run_id": run_id, "base_run_id": delta.base_run_id},
+            "findings": [],
+        }
+
+
+async def run_cartographer(
+    api_key: str,
+    repo_context: str,
+    cache_scope: str,
+    prior: dict[str, Any] | None = None,
+) -> tuple[dict[str, Any], str]:
+    prior_context = ""
+    if prior is not None:
+        prior_context = (
+            "Only the files below changed (or depend on changed files). Map just these files; "
+            "the previous map covers everything else.\n\n"
+            f"Previous map:\n{json.dumps(prior, indent=2)}\n\n"
+        )
+    raw = await invoke_agent(
+        api_key=api_key,
+        agent_name="Agent 1 - The Cartographer",
+        system_prompt=(
+            "You are The Cartographer. Map global state, cross-file dependencies, "
+            "and mutation edges precisely."
+        ),
+        user_prompt=(
+            "Analyze this repository context.\n"
+            "Return JSON only with keys: global_state_map, cross_file_dependencies, "
+            "mutation_hotspots, high_risk_flows.\n\n"
+            f"{prior_context}{repo_context}"
+        ),
+        cache_scope=cache_scope,
+    )
+    return extract_json(raw), raw
+
+
+async def run_context_injector(
+    api_key: str,
+    cartographer: dict[str, Any],
+    docs_context: str,
+    metadata_context: str,
+    cache_scope: str,
+) -> tuple[dict[str, Any], str]:
+    raw = await invoke_agent(
+        api_key=api_key,
+        agent_name="Agent 2 - The Context Injector",
+        system_prompt=(
+            "You are The Context Injector. Infer business intent from docs and metadata. "
+            "State invariants that must never break."
+        ),
+        user_prompt=(
+            "Given cartography output and project docs, infer business invariants.\n"
+            "Return JSON only with keys: inferred_business_invariants, trust_boundaries, "
+            "asset_priorities, contradiction_candidates.\n\n"
+            f"Cartographer output:\n{json.dumps(cartographer, indent=2)}\n\n"
+            f"Documentation context:\n{docs_context}\n\n"
+            f"Metadata context:\n{metadata_context}"
+        ),
+        cache_scope=cache_scope,
+    )
+    return extract_json(raw), raw
+
+
+async def run_adversary(
+    api_key: str,
+    cartographer: dict[str, Any],
+    injector: dict[str, Any],
+    repo_context: str,
+    cache_scope: str,
+    on_candidate: Callable[[Any], None] | None = None,
+) -> tuple[dict[str, Any], str]:
+    raw = await invoke_agent(
+        api_key=api_key,
+        agent_name="Agent 3 - The Adversary",
+        system_prompt=(
+            "You are The Adversary. Hunt for logic bypasses, state contradictions, "
+            "and cross-file exploit paths. Demand concrete proof."
+        ),
+        user_prompt=(
+            "Find exploit-capable logic flaws using repository context plus prior analysis.\n"
+            "Return JSON only with key candidate_findings where each finding has: "
+            "error_name, explanation, location, exploitability_proof, recommendation, confidence.\n\n"
+            f"Cartographer output:\n{json.dumps(cartographer, indent=2)}\n\n"
+            f"Context Injector output:\n{json.dumps(injector, indent=2)}\n\n"
+            f"Repository context:\n{repo_context}"
+        ),
+        cache_scope=cache_scope,
+        array_key="candidate_findings",
+        on_item=on_candidate,
+    )
+    return extract_json(raw), raw
+
+
+async def fan_out_adversary(
+    api_key: str,
+    cartographer: dict[str, Any],
+    injector: dict[str, Any],
+    index: RepoIndex,
+    contents: Mapping[str, str],
+    shards: list[list[str]],
+    cache_scope: str,
+    on_candidate: Callable[[Any], None] | None = None,
+) -> tuple[dict[str, Any], str, list[list[str]]]:
+    """Run the Adversary over every shard concurrently and reduce the candidates.
+
+    At most ``K2_MAX_CONCURRENCY`` shards are in flight at once. Shard progress
+    is emitted as log events. ``on_candidate`` sees every candidate as soon as
+    its shard streams it, before any reduction. Returns the reduced output, its
+    raw text and the shards that failed; raises only if every shard failed.
+    """
+    limit = asyncio.Semaphore(K2_MAX_CONCURRENCY)
+
+    async def run_shard(shard: list[str]) -> tuple[list[str], tuple[dict[str, Any], str] | Exception]:
+        try:
+            async with limit:
+                context = await asyncio.to_thread(
+                    render_context, index, contents, shard, ADVERSARY_SHARD_TOKENS, sorted(index.neighbours(shard))
+                )
+                return shard, await run_adversary(api_key, cartographer, injector, context, cache_scope, on_candidate)
+        except Exception as error:
+            return shard, error
+
+    tasks = [asyncio.create_task(run_shard(shard)) for shard in shards]
+    outputs: list[dict[str, Any]] = []
+    raws: list[str] = []
+    failures: list[Exception] = []
+    failed_shards: list[list[str]] = []
+    try:
+        for completed in asyncio.as_completed(tasks):
+            shard, result = await completed
+            if isinstance(result, Exception):
+                failures.append(result)
+                failed_shards.append(shard)
+                emit(
+                    log_event(
+                        "Adversary",
+                        f"Shard {len(outputs) + len(failures)}/{len(tasks)} ({len(shard)} files) failed: "
+                        f"{type(result).__name__}: {result}",
+                    )
+                )
+                continue
+            adversary, raw = result
+            outputs.append(adversary)
+            raws.append(raw)
+            if len(tasks) > 1:
+                candidates = adversary.get("candidate_findings")
+                emit(
+                    log_event(
+                        "Adversary",
+                        f"Shard {len(outputs) + len(failures)}/{len(tasks)} ({len(shard)} files) proposed "
+                        f"{len(candidates) if isinstance(candidates, list) else 0} candidates.",
+                    )
+                )
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if failures and not outputs:
+        raise failures[0]
+    if len(outputs) == 1 and not failures:
+        return outputs[0], raws[0], []
+    adversary = reduce_candidates(outputs, ADVERSARY_MAX_CANDIDATES)
+    return adversary, json.dumps(adversary, ensure_ascii=False), failed_shards
+
+
+async def hunt_and_roast(
+    api_key: str,
+    cartographer: dict[str, Any],
+    injector: dict[str, Any],
+    index: RepoIndex,
+    contents: Mapping[str, str],
+    shards: list[list[str]],
+    cache_scope: str,
+    adversary_summary: str,
+) -> tuple[dict[str, Any], list[list[str]]]:
+    """Run the Adversary and the Roaster as a pipeline.
+
+    Returns the combined Roaster output and the Adversary shards that failed.
+    Each distinct candidate is emitted as a ``candidate`` event the moment a
+    shard streams it, and the Roaster judges everything that arrived since its
+    previous call while the Adversary keeps generating, so batches grow when
+    the Roaster is the slower stage. Up to ``ADVERSARY_MAX_CANDIDATES`` streamed
+    candidates are judged this way, in arrival order.
+
+    Batches depend on timing, so the output handed to the Auditor does not:
+    it holds the verdicts for the reduced Adversary output (see
+    ``reduce_candidates``) in its order, and ``run_roaster`` caches verdicts
+    per candidate. A repeated run therefore sends the Auditor the same prompt
+    and hits its cache. Streamed candidates that miss the reduced output are
+    judged but not audited.
+    """
+    accepted: set[str] = set()
+    queued: set[str] = set()
+    pending: list[dict[str, Any]] = []
+    verdicts: dict[str, list[Any]] = {}
+    arrived = asyncio.Event()
+    hunting = True
+
+    def enqueue(candidate: dict[str, Any]) -> None:
+        digest = canonical_candidate(candidate)
+        if digest in queued:
+            return
+        queued.add(digest)
+        pending.append(candidate)
+        arrived.set()
+
+    def on_candidate(candidate: Any) -> None:
+        if not isinstance(candidate, dict):
+            return
+        key = candidate_key(candidate)
+        if key in accepted or len(accepted) >= ADVERSARY_MAX_CANDIDATES:
+            return
+        accepted.add(key)
+        emit({"type": "candidate", "agent": "Adversary", "candidate": candidate})
+        enqueue(candidate)
+
+    async def roast() -> int:
+        batches = 0
+        while True:
+            if not pending:
+                if not hunting:
+                    return batches
+                arrived.clear()
+                await arrived.wait()
+                continue
+            batch = pending.copy()
+            pending.clear()
+            judged, raw = await run_roaster(api_key, batch, cache_scope)
+            batches += 1
+            for candidate, items in zip(batch, judged):
+                verdicts[canonical_candidate(candidate)] = items
+            kept = sum(1 for items in judged for item in items if isinstance(item, dict) and item.get("keep", True))
+            emit(
+                log_event(
+                    "Roaster/Critic",
+                    f"Judged {len(batch)} candidate(s); retained {kept} with exploitability proof.",
+                    raw,
+                )
+            )
+
+    roaster_task = asyncio.create_task(roast())
+    try:
+        adversary, adversary_raw, failed_shards = await fan_out_adversary(
+            api_key, cartographer, injector, index, contents, shards, cache_scope, on_candidate
+        )
+        emit(log_event("Adversary", summarize_agent(adversary, adversary_summary), adversary_raw))
+        if failed_shards:
+            emit(
+                log_event(
+                    "Adversary",
+                    f"{len(failed_shards)} of {len(shards)} shard(s) failed; "
+                    f"{sum(len(shard) for shard in failed_shards)} files were not analysed and the run is partial.",
+                )
+            )
+        final = reduce_candidates([adversary], ADVERSARY_MAX_CANDIDATES)["candidate_findings"]
+        for candidate in final:
+            # Candidates the incremental parser missed (e.g. JSON that only
+            # extract_json could repair) are announced here.
+            key = candidate_key(candidate)
+            if key not in accepted:
+                accepted.add(key)
+                emit({"type": "candidate", "agent": "Adversary", "candidate": candidate})
+            enqueue(candidate)
+    except BaseException:
+        roaster_task.cancel()
+        raise
+    finally:
+        hunting = False
+        arrived.set()
+
+    if not await roaster_task:
+        emit(log_event("Roaster/Critic", "The Adversary proposed no candidates to roast."))
+    roasted = [item for candidate in final for item in verdicts.get(canonical_candidate(candidate), [])]
+    return {"roasted_findings": roasted}, failed_shards
+
+
+def reduce_candidates(outputs: list[dict[str, Any]], limit: int) -> dict[str, Any]:
+    best: dict[str, dict[str, Any]] = {}
+    for output in outputs:
+        candidates = output.get("candidate_findings")
+        if not isinstance(candidates, list):
+            continue
+        for candidate in candidates:
+            if not isinstance(candidate, dict):
+                continue
+            key = candidate_key(candidate)
+            if key not in best or _rank(candidate) > _rank(best[key]):
+                best[key] = candidate
+    # Order on content as well as confidence so the result does not depend on
+    # which shard finished first.
+    ranked = sorted(best.values(), key=lambda candidate: (-_confidence(candidate), candidate_key(candidate)))
+    return {"candidate_findings": ranked[:limit]}
+
+
+def candidate_key(candidate: dict[str, Any]) -> str:
+    return (
+        f"{str(candidate.get('error_name', '')).strip().lower()}:"
+        f"{normalize_location(str(candidate.get('location', '')))}"
+    )
+
+
+def canonical_candidate(candidate: dict[str, Any]) -> str:
+    return json.dumps(candidate, sort_keys=True, ensure_ascii=False)
+
+
+def _rank(candidate: dict[str, Any]) -> tuple[float, str]:
+    return _confidence(candidate), canonical_candidate(candidate)
+
+
+def _confidence(candidate: dict[str, Any]) -> float:
+    try:
+        return float(candidate.get("confidence", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+async def run_roaster(
+    api_key: str, candidates: list[dict[str, Any]], cache_scope: str
+) -> tuple[list[list[Any]], str]:
+    """Judge ``candidates`` and return the Roaster's verdicts for each of them, plus its raw reply.
+
+    Verdicts are cached per candidate, keyed on the request that candidate
+    would make on its own, so a candidate is judged once whichever batch it
+    arrives in. The uncached candidates are sent to K2 together; the raw reply
+    is empty when every verdict came from the cache.
+    """
+    agent_name = "Agent 4 - The Roaster/Critic"
+    system_prompt = (
+        "You are The Roaster/Critic. Aggressively reject weak findings. "
+        "Only keep claims with explicit exploitability proof and concrete locations."
+    )
+
+    def user_prompt(batch: list[dict[str, Any]]) -> str:
+        return (
+            "Roast the Adversary findings. Remove weak claims and demand proof.\n"
+            "Return JSON only with key roasted_findings where each finding has: "
+            "keep (boolean), error_name, location, roast_summary, proof, recommendation, severity.\n\n"
+            f"Adversary output:\n{json.dumps({'candidate_findings': batch}, indent=2)}"
+        )
+
+    agent = agent_label(agent_name)
+    keys = [AgentCache.key(agent_payload(system_prompt, user_prompt([candidate])), cache_scope) for candidate in candidates]
+    verdicts: list[list[Any] | None] = []
+    for cached in await asyncio.to_thread(agent_cache.get_many, keys):
+        AGENT_CACHE_TOTAL.inc(agent=agent, result="miss" if cached is None else "hit")
+        verdicts.append(None if cached is None else json.loads(cached))
+
+    misses = [position for position, verdict in enumerate(verdicts) if verdict is None]
+    raw = ""
+    if misses:
+        raw = await invoke_agent(
+            api_key=api_key,
+            agent_name=agent_name,
+            system_prompt=system_prompt,
+            user_prompt=user_prompt([candidates[position] for position in misses]),
+            cache_scope=cache_scope,
+            use_cache=False,
+        )
+        judged = extract_json(raw).get("roasted_findings")
+        assigned = assign_verdicts([candidates[position] for position in misses], judged if isinstance(judged, list) else [])
+        for position, items in zip(misses, assigned):
+            verdicts[position] = items
+        if isinstance(judged, list):
+            await asyncio.to_thread(
+                agent_cache.put_many,
+                [(keys[position], json.dumps(items, ensure_ascii=False)) for position, items in zip(misses, assigned)],
+            )
+    return [verdict or [] for verdict in verdicts], raw
+
+
+def assign_verdicts(candidates: list[dict[str, Any]], judged: list[Any]) -> list[list[Any]]:
+    """Split a batched Roaster reply into the verdicts for each candidate.
+
+    Verdicts are matched on ``candidate_key``; unmatched ones go, in order, to
+    candidates that have none yet, and any remainder to the last candidate.
+    A candidate left without a verdict was rejected by the Roaster.
+    """
+    positions = {candidate_key(candidate): position for position, candidate in enumerate(candidates)}
+    assigned: list[list[Any]] = [[] for _ in candidates]
+    unmatched = []
+    for item in judged:
+        position = positions.get(candidate_key(item)) if isinstance(item, dict) else None
+        if position is None:
+            unmatched.append(item)
+        else:
+            assigned[position].append(item)
+    empty = [position for position, items in enumerate(assigned) if not items]
+    for item in unmatched:
+        assigned[empty.pop(0) if empty else -1].append(item)
+    return assigned
+
+
+async def run_auditor(
+    api_key: str,
+    roaster: dict[str, Any],
+    cache_scope: str,
+    on_finding: Callable[[Any], None] | None = None,
+) -> tuple[list[Finding], str]:
+    raw = await invoke_agent(
+        api_key=api_key,
+        agent_name="Agent 5 - The Auditor",
+        system_prompt=(
+            "You are The Auditor. Produce final report entries only for roasted, "
+            "critical, exploitable findings."
+        ),
+        user_prompt=(
+            'Compile final findings in strict JSON. Return only: {"final_findings": [ ... ]}.\n'
+            "Each finding must contain exactly these keys:\n"
+            "error_name, explanation, location, roast_summary, recommendation.\n"
+            "location must be path:line.\n\n"
+            f"Roaster output:\n{json.dumps(roaster, indent=2)}"
+        ),
+        cache_scope=cache_scope,
+        array_key="final_findings",
+        on_item=on_finding,
+    )
+    return normalize_findings(extract_json(raw).get("final_findings", [])), raw
+
+
+async def invoke_agent(
+    *,
+    api_key: str,
+    agent_name: str,
+    system_prompt: str,
+    user_prompt: str,
+    cache_scope: str = "",
+    array_key: str | None = None,
+    on_item: Callable[[Any], None] | None = None,
+    use_cache: bool = True,
+) -> str:
+    """Return the agent's reply, from the cache or streamed from K2.
+
+    With ``array_key`` and ``on_item``, each element of that top-level array
+    is handed to ``on_item`` as soon as it is complete. ``use_cache=False`` is
+    for callers that cache the parsed reply themselves.
+    """
+    payload = agent_payload(system_prompt, user_prompt)
+    items = JsonArrayStream(array_key) if array_key and on_item is not None else None
+    agent = agent_label(agent_name)
+
+    with span("agent") as call:
+        call["agent"] = agent
+        cache_key = AgentCache.key(payload, cache_scope)
+        cached = await asyncio.to_thread(agent_cache.get, cache_key) if use_cache else None
+        if use_cache:
+            AGENT_CACHE_TOTAL.inc(agent=agent, result="miss" if cached is None else "hit")
+            call["cache"] = "miss" if cached is None else "hit"
+        if cached is not None:
+            if items is not None:
+                for item in items.feed(cached):
+                    on_item(item)
+            return cached
+
+        started = time.perf_counter()
+        token = _agent_call.set(call)
+        try:
+            content = await stream_agent(payload, api_key, agent_name, items, on_item, call)
+            if not content.strip():
+                raise RuntimeError(f"{agent_name} returned empty content.")
+        except Exception:
+            AGENT_ERRORS_TOTAL.inc(agent=agent)
+            raise
+        finally:
+            _agent_call.reset(token)
+        AGENT_SECONDS.observe(time.perf_counter() - started, agent=agent)
+
+        usage = call.pop("usage", None) or {}
+        call["request_bytes"] = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        call["response_bytes"] = len(content.encode("utf-8"))
+        call["prompt_tokens"] = usage.get("prompt_tokens") or estimate_tokens(system_prompt + user_prompt)
+        call["completion_tokens"] = usage.get("completion_tokens") or estimate_tokens(content)
+        AGENT_BYTES_TOTAL.inc(call["request_bytes"], agent=agent, direction="request")
+        AGENT_BYTES_TOTAL.inc(call["response_bytes"], agent=agent, direction="response")
+        AGENT_TOKENS_TOTAL.inc(call["prompt_tokens"], agent=agent, kind="prompt")
+        AGENT_TOKENS_TOTAL.inc(call["completion_tokens"], agent=agent, kind="completion")
+
+    content = content.strip()
+    if use_cache:
+        await asyncio.to_thread(agent_cache.put, cache_key, content)
+    return content
+
+
+def agent_payload(system_prompt: str, user_prompt: str) -> dict[str, Any]:
+    return {
+        "model": K2_MODEL,
+        "temperature": 0.15,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+    }
+
+
+async def stream_agent(
+    payload: dict[str, Any],
+    api_key: str,
+    agent_name: str,
+    items: JsonArrayStream | None,
+    on_item: Callable[[Any], None] | None,
+    call: dict[str, Any],
+) -> str:
+    """Collect a completion, feeding ``items`` and emitting progress events as it streams.
+
+    Time to the first content and any token usage K2 reported are left in ``call``.
+    """
+    started = time.perf_counter()
+    if not K2_STREAMING:
+        body = await _invoke_k2(payload, api_key, agent_name)
+        choices = body.get("choices", [])
+        if not choices:
+            raise RuntimeError(f"{agent_name} returned no choices.")
+        content = choices[0].get("message", {}).get("content")
+        if not isinstance(content, str):
+            raise RuntimeError(f"{agent_name} returned empty content.")
+        record_first_token(call, started)
+        if isinstance(body.get("usage"), dict):
+            call["usage"] = body["usage"]
+        parts = [content]
+    else:
+        parts = []
+        received = 0
+        loop = asyncio.get_running_loop()
+        reported = loop.time()
+        async with aclosing(get_k2_client().stream_chat_completion(payload, api_key, agent_name)) as deltas:
+            async for delta in deltas:
+                if not parts:
+                    record_first_token(call, started)
+                parts.append(delta)
+                received += len(delta)
+                if items is not None:
+                    for item in items.feed(delta):
+                        on_item(item)
+                if loop.time() - reported >= AGENT_PROGRESS_SECONDS:
+                    reported = loop.time()
+                    emit({"type": "progress", "agent": agent_name, "chars": received})
+        return "".join(parts)
+
+    if items is not None:
+        for item in items.feed(parts[0]):
+            on_item(item)
+    return parts[0]
+
+
+def record_first_token(call: dict[str, Any], started: float) -> None:
+    elapsed = time.perf_counter() - started
+    AGENT_FIRST_TOKEN_SECONDS.observe(elapsed, agent=call["agent"])
+    call["first_token_ms"] = round(elapsed * 1000, 3)
+
+
+def record_retry(agent_name: str, error: K2RequestError) -> None:
+    AGENT_RETRIES_TOTAL.inc(agent=agent_label(agent_name))
+    call = _agent_call.get()
+    if call is not None:
+        call["retries"] = call.get("retries", 0) + 1
+
+
+def agent_label(agent_name: str) -> str:
+    """``"Agent 3 - The Adversary"`` -> ``"Adversary"``."""
+    return agent_name.rpartition(" The ")[2]
+
+
+async def _invoke_k2(
+    payload: dict[str, Any],
+    api_key: str,
+    agent_name: str,
+) -> dict[str, Any]:
+    return await get_k2_client().chat_completion(payload, api_key, agent_name)
+
+
+def get_k2_client() -> K2Client:
+    global _k2_client
+    if _k2_client is None:
+        _k2_client = K2Client(
+            K2_API_URL,
+            max_concurrency=K2_MAX_CONCURRENCY,
+            pool_size=K2_MAX_CONCURRENCY,
+            timeout=K2_TIMEOUT_SECONDS,
+            max_retries=K2_MAX_RETRIES,
+            on_retry=record_retry,
+            acquire_timeout=K2_ACQUIRE_TIMEOUT_SECONDS,
+        )
+    return _k2_client
+
+
+@PARSE_SECONDS.time(step="extract_json")
+def extract_json(raw: str) -> dict[str, Any]:
+    stripped = raw.strip()
+    if stripped.startswith("```"):
+        stripped = re.sub(r"^```(?:json)?", "", stripped).strip()
+        stripped = re.sub(r"```$", "", stripped).strip()
+
+    try:
+        parsed = json.loads(stripped)
+        if isinstance(parsed, dict):
+            return parsed
+    except json.JSONDecodeError:
+        pass
+
+    first = stripped.find("{")
+    last = stripped.rfind("}")
+    if first != -1 and last != -1 and first < last:
+        try:
+            parsed = json.loads(stripped[first : last + 1])
+            if isinstance(parsed, dict):
+                return parsed
+        except json.JSONDecodeError:
+            pass
+
+    return {}
+
+
+@PARSE_SECONDS.time(step="normalize_findings")
+def normalize_findings(raw_findings: Any) -> list[Finding]:
+    if not isinstance(raw_findings, list):
+        return []
+
+    normalized: list[Finding] = []
+    for item in raw_findings:
+        if not isinstance(item, dict):
+            continue
+        finding = Finding(
+            error_name=str(item.get("error_name", "Unspecified Critical Flaw")).strip(),
+            explanation=str(item.get("explanation", "Business logic risk identified.")).strip(),
+            location=normalize_location(str(item.get("location", "unknown:1"))),
+            roast_summary=str(
+                item.get(
+                    "roast_summary",
+                    "Roaster retained this issue because exploitability proof survived scrutiny.",
+                )
+            ).strip(),
+            recommendation=str(
+                item.get(
+                    "recommendation",
+                    "Add strict invariant checks and regression tests for this execution path.",
+                )
+            ).strip(),
+        )
+        normalized.append(finding)
+
+    return normalized
+
+
+def normalize_location(location: str) -> str:
+    cleaned = location.strip()
+    match = re.match(r"^(.*):(\d+)$", cleaned)
+    if match:
+        return f"{match.group(1)}:{match.group(2)}"
+    return "unknown:1"
+
+
+def summarize_agent(parsed: dict[str, Any], fallback: str) -> str:
+    if not parsed:
+        return fallback
+    keys = list(parsed.keys())
+    return f"{fallback} Output keys: {', '.join(keys[:5])}."
+
+
+def to_ndjson(payload: dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+
+def log_event(agent: str, message: str, raw: str | None = None) -> dict[str, Any]:
+    event = {
+        "type": "log",
+        "agent": agent,
+        "message": message,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    if raw:
+        event["raw"] = raw[:2200]
+    return event
+
+
+def emit(event: dict[str, Any]) -> None:
+    """Send an event to the stream of the stage running in this task, if any (see ``stage_events``)."""
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event)
+
+
+async def stage_events(name: str, stage: Awaitable[Any], result: dict[str, Any]) -> AsyncIterator[dict[str, Any]]:
+    """Run ``stage`` in its own task and yield the events it emits while it runs.
+
+    Its return value is left in ``result["value"]``; an exception it raises is
+    re-raised once its events have been yielded. The stage is timed as ``name``.
+    """
+    queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+
+    async def run() -> Any:
+        _event_sink.set(queue.put_nowait)
+        with stage_span(name):
+            return await stage
+
+    task = asyncio.create_task(run())
+    getter: asyncio.Future[dict[str, Any]] | None = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                break
+            yield getter.result()
+        while not queue.empty():
+            yield queue.get_nowait()
+        result["value"] = task.result()
+    finally:
+        if getter is not None:
+            getter.cancel()
+        task.cancel()
+
+
+def stage_span(name: str) -> AbstractContextManager[dict[str, Any]]:
+    return span(name, STAGE_SECONDS, stage=name)
+
+
+def select_repo_context(index: RepoIndex, contents: Mapping[str, str], budget: int) -> str:
+    if index.total_tokens <= budget:
+        return render_context(index, contents, list(contents), budget)
+    return render_context(index, contents, priority_order(index), budget)
+
+
+def extract_docs_context(files: Mapping[str, str]) -> str:
+    docs = []
+    for path in files:
+        if is_doc_path(path):
+            docs.append(f"### DOC: {path}\n{files[path]}")
+            if len(docs) == 25:
+                break
+    if not docs:
+        return "No documentation files detected."
+    return "\n\n".join(docs)
+
+
+def extract_metadata_context(files: Mapping[str, str]) -> str:
+    metadata = []
+    for path in files:
+        if is_metadata_path(path):
+            metadata.append(f"### META: {path}\n{files[path]}")
+            if len(metadata) == 20:
+                break
+    if not metadata:
+        return "No metadata files detected."
+    return "\n\n".join(metadata)
+
+
+def is_doc_path(path: str) -> bool:
+    lower = path.lower()
+    return lower.endswith(".md") or lower.endswith(".rst") or "readme" in lower
+
+
+def is_metadata_path(path: str) -> bool:
+    return path.endswith(("package.json", "pyproject.toml", "requirements.txt", ".env.example"))
+
+
+def heuristic_findings(files: Mapping[str, str]) -> list[Finding]:
+    rules = {rule.id: rule for rule in heuristic_engine.rules}
+    findings: list[Finding] = []
+    for path, line, rule_id in heuristic_engine.scan_files(files.items()):
+        rule = rules[rule_id]
+        findings.append(
+            Finding(
+                error_name=rule.error_name,
+                explanation=rule.explanation,
+                location=f"{path}:{line}",
+                roast_summary=rule.roast_summary,
+                recommendation=rule.recommendation,
+            )
+        )
+        if len(findings) == 12:
+            break
+    return findings
@@ -0,0 +1,395 @@
+import posixpath
+import re
+from typing import Iterable, Mapping
+
+from pydantic import BaseModel, PrivateAttr
+
+JS_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+PY_EXTENSIONS = (".py",)
+
+_JS_IMPORT_PATTERN = re.compile(
+    r"""(?:\bimport\s+(?:[\w*{}\s,]+\s+from\s+)?|\bexport\s+[\w*{}\s,]+\s+from\s+|\brequire\s*\(\s*|\bimport\s*\(\s*)["']([^"']+)["']"""
+)
+_PY_IMPORT_PATTERN = re.compile(r"^\s*(?:from\s+(\.*[\w.]*)\s+import\s+([\w*, ]+)|import\s+([\w., ]+))", re.MULTILINE)
+
+_JS_SYMBOL_PATTERN = re.compile(
+    r"^(?:export\s+(?:default\s+)?)?(?:async\s+)?(?:function\s*\*?\s*(\w+)|class\s+(\w+)|(?:const|let|var)\s+(\w+))",
+    re.MULTILINE,
+)
+_JS_GLOBAL_PATTERN = re.compile(
+    r"^(?:export\s+)?(?:(?:let|var)\s+(\w+)(?!\s*=[^;\n]*\brequire\s*\()"
+    r"(?!\s*=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>|\w+\s*=>))"
+    r"|const\s+(\w+)\s*=\s*(?:\{|\[|new\s))",
+    re.MULTILINE,
+)
+_JS_DECLARATION_PATTERN = re.compile(r"^\s*(?:export\s+)?(?:let|var|const)\s")
+_JS_IMPORTED_BINDINGS_PATTERN = re.compile(
+    r"^\s*(?:const|let|var)\s+(?:\{([^}]*)\}|(\w+))\s*=\s*require\s*\(|^\s*import\s+(?:(\w+)\s*,?\s*)?(?:\{([^}]*)\})?\s*from\b",
+    re.MULTILINE,
+)
+_PY_SYMBOL_PATTERN = re.compile(r"^(?:async\s+def|def|class)\s+(\w+)|^(\w+)\s*(?::[^=\n]+)?=(?!=)", re.MULTILINE)
+_MUTATION_SUFFIX = (
+    r"(?:\.\w+|\[[^\]\n]*\])*\s*(?:[-+*/%|&^]|\*\*|<<|>>|\?\?)?=(?!=)"
+    r"|(?:\.\w+|\[[^\]\n]*\])*\.(?:push|pop|shift|unshift|splice|sort|reverse|set|delete|add|clear|append|extend|insert|remove|update|setdefault)\("
+)
+
+CHARS_PER_TOKEN = 4
+_SEPARATOR = "\n\n"
+
+
+class FileIndex(BaseModel):
+    path: str
+    # What the file costs inside a rendered context, header and separator included.
+    tokens: int
+    symbols: list[str]
+    imports: list[str]
+    global_state: list[str]
+    mutation_sites: list[int]
+
+
+class RepoIndex(BaseModel):
+    files: dict[str, FileIndex]
+    _importers: dict[str, set[str]] | None = PrivateAttr(default=None)
+
+    @property
+    def graph(self) -> dict[str, set[str]]:
+        return {path: set(entry.imports) for path, entry in self.files.items()}
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(entry.tokens for entry in self.files.values())
+
+    def importers(self) -> dict[str, set[str]]:
+        """Map each path to the files importing it; built once and shared, so treat it as read-only."""
+        if self._importers is None:
+            reverse: dict[str, set[str]] = {path: set() for path in self.files}
+            for path, entry in self.files.items():
+                for imported in entry.imports:
+                    reverse.setdefault(imported, set()).add(path)
+            self._importers = reverse
+        return self._importers
+
+    def neighbours(self, paths: Iterable[str]) -> set[str]:
+        selected = set(paths)
+        reverse = self.importers()
+        found: set[str] = set()
+        for path in selected:
+            found.update(self.files[path].imports if path in self.files else ())
+            found.update(reverse.get(path, ()))
+        return found - selected
+
+    def summary(self) -> str:
+        symbols = sum(len(entry.symbols) for entry in self.files.values())
+        edges = sum(len(entry.imports) for entry in self.files.values())
+        mutations = sum(len(entry.mutation_sites) for entry in self.files.values())
+        return (
+            f"Indexed {len(self.files)} files: {symbols} symbols, {edges} import edges, "
+            f"{mutations} global-state mutation sites."
+        )
+
+
+def build_import_graph(files: Mapping[str, str]) -> dict[str, set[str]]:
+    """Map each path to the workspace paths it imports or requires."""
+    paths = set(files)
+    modules = {_python_module(path): path for path in paths if path.endswith(PY_EXTENSIONS)}
+    graph: dict[str, set[str]] = {}
+    for path, content in files.items():
+        if path.endswith(JS_EXTENSIONS):
+            targets = _js_imports(path, content, paths)
+        elif path.endswith(PY_EXTENSIONS):
+            targets = _python_imports(path, content, modules)
+        else:
+            targets = set()
+        targets.discard(path)
+        graph[path] = targets
+    return graph
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def file_block(path: str, content: str) -> str:
+    return f"### FILE: {path}\n{content}"
+
+
+def file_tokens(path: str, content: str) -> int:
+    """Token cost of one file in ``render_context``, counting its header and the separator after it."""
+    return estimate_tokens(file_block(path, content) + _SEPARATOR)
+
+
+def build_repo_index(files: Mapping[str, str]) -> RepoIndex:
+    """Index symbols, imports and global-state mutation sites for every file."""
+    graph = build_import_graph(files)
+    exported_state = {path: _global_state(path, content) for path, content in files.items()}
+    entries = {}
+    for path, content in files.items():
+        if path.endswith(JS_EXTENSIONS):
+            symbols = [next(name for name in match if name) for match in _JS_SYMBOL_PATTERN.findall(content)]
+            imported_state = _imported_state(graph[path], exported_state)
+            tracked = set(exported_state[path]) | (_js_imported_bindings(content) & imported_state)
+        elif path.endswith(PY_EXTENSIONS):
+            symbols = [next(name for name in match if name) for match in _PY_SYMBOL_PATTERN.findall(content)]
+            tracked = set(exported_state[path])
+        else:
+            symbols, tracked = [], set()
+        entries[path] = FileIndex(
+            path=path,
+            tokens=file_tokens(path, content),
+            symbols=list(dict.fromkeys(symbols)),
+            imports=sorted(graph[path]),
+            global_state=exported_state[path],
+            mutation_sites=_mutation_sites(content, tracked),
+        )
+    return RepoIndex(files=entries)
+
+
+def plan_shards(index: RepoIndex, budget: int, paths: Iterable[str] | None = None) -> list[list[str]]:
+    """Split files into dependency-coherent shards of at most ``budget`` tokens.
+
+    Files connected by imports stay together where the budget allows; larger
+    components are cut in breadth-first order so neighbours share a shard.
+    """
+    selected = set(index.files if paths is None else paths) & set(index.files)
+    reverse = index.importers()
+    groups: list[list[str]] = []
+    seen: set[str] = set()
+    for start in sorted(selected):
+        if start in seen:
+            continue
+        order = []
+        queue = [start]
+        seen.add(start)
+        while queue:
+            current = queue.pop(0)
+            order.append(current)
+            for neighbour in sorted(set(index.files[current].imports) | reverse.get(current, set())):
+                if neighbour in selected and neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        groups.extend(_split_by_budget(index, order, budget))
+
+    shards: list[tuple[int, list[str]]] = []
+    for group in sorted(groups, key=lambda group: -_tokens(index, group)):
+        size = _tokens(index, group)
+        for position, (used, shard) in enumerate(shards):
+            if used + size <= budget:
+                shards[position] = (used + size, shard + group)
+                break
+        else:
+            shards.append((size, list(group)))
+    return [shard for _, shard in shards]
+
+
+def render_context(
+    index: RepoIndex,
+    files: Mapping[str, str],
+    paths: Iterable[str],
+    budget: int,
+    outline: Iterable[str] = (),
+) -> str:
+    """Render full files in priority order until ``budget`` tokens, then outlines."""
+    chunks = []
+    used = 0
+    rendered: set[str] = set()
+    outlined = []
+    for path in paths:
+        chunk = file_block(path, files[path])
+        cost = file_tokens(path, files[path])
+        if used + cost <= budget:
+            chunks.append(chunk)
+            used += cost
+        elif not chunks:
+            limit = budget * CHARS_PER_TOKEN
+            chunks.append(f"{chunk[:limit]}\n... [truncated {len(chunk) - limit} characters]")
+            used = budget
+        else:
+            outlined.append(path)
+            continue
+        rendered.add(path)
+
+    outline_budget = max(budget // 4, 256)
+    outlined.extend(path for path in outline if path not in rendered and path not in outlined)
+    for path in outlined:
+        entry = index.files.get(path)
+        if entry is None:
+            continue
+        chunk = _outline(entry)
+        cost = estimate_tokens(chunk)
+        if cost > outline_budget:
+            break
+        chunks.append(chunk)
+        outline_budget -= cost
+    return _SEPARATOR.join(chunks)
+
+
+def priority_order(index: RepoIndex) -> list[str]:
+    """Files that mutate global state or are widely imported come first."""
+    reverse = index.importers()
+    return sorted(
+        index.files,
+        key=lambda path: (-len(index.files[path].mutation_sites), -len(reverse.get(path, ())), path),
+    )
+
+
+def _outline(entry: FileIndex) -> str:
+    lines = [f"### OUTLINE: {entry.path}"]
+    if entry.symbols:
+        lines.append(f"symbols: {', '.join(entry.symbols[:40])}")
+    if entry.imports:
+        lines.append(f"imports: {', '.join(entry.imports)}")
+    if entry.global_state:
+        lines.append(f"global state: {', '.join(entry.global_state)}")
+    if entry.mutation_sites:
+        lines.append(f"global-state mutations at lines: {', '.join(map(str, entry.mutation_sites[:40]))}")
+    return "\n".join(lines)
+
+
+def _tokens(index: RepoIndex, paths: Iterable[str]) -> int:
+    return sum(index.files[path].tokens for path in paths)
+
+
+def _split_by_budget(index: RepoIndex, order: list[str], budget: int) -> list[list[str]]:
+    groups: list[list[str]] = [[]]
+    used = 0
+    for path in order:
+        cost = index.files[path].tokens
+        if groups[-1] and used + cost > budget:
+            groups.append([])
+            used = 0
+        groups[-1].append(path)
+        used += cost
+    return [group for group in groups if group]
+
+
+def _global_state(path: str, content: str) -> list[str]:
+    if path.endswith(JS_EXTENSIONS):
+        return list(dict.fromkeys(mutable or constant for mutable, constant in _JS_GLOBAL_PATTERN.findall(content)))
+    if path.endswith(PY_EXTENSIONS):
+        return list(
+            dict.fromkeys(
+                name
+                for _, name in _PY_SYMBOL_PATTERN.findall(content)
+                if name and not name.isupper() and not name.startswith("__")
+            )
+        )
+    return []
+
+
+def _imported_state(imports: Iterable[str], exported_state: Mapping[str, list[str]]) -> set[str]:
+    names: set[str] = set()
+    for imported in imports:
+        names.update(exported_state.get(imported, ()))
+    return names
+
+
+def _js_imported_bindings(content: str) -> set[str]:
+    names: set[str] = set()
+    for destructured, single, default, named in _JS_IMPORTED_BINDINGS_PATTERN.findall(content):
+        for group in (destructured, named):
+            for binding in group.split(","):
+                local = binding.split(":")[-1].split(" as ")[-1].strip()
+                if local:
+                    names.add(local)
+        names.update(name for name in (single, default) if name)
+    return names
+
+
+def _mutation_sites(content: str, names: set[str]) -> list[int]:
+    if not names:
+        return []
+    alternatives = "|".join(map(re.escape, sorted(names)))
+    pattern = re.compile(rf"(?<![\w.])(?:{alternatives})(?:{_MUTATION_SUFFIX})")
+    module_level = re.compile(rf"^(?:{alternatives})\s*(?::[^=\n]+)?=(?!=)")
+    declared: set[str] = set()
+    sites = []
+    for number, line in enumerate(content.splitlines(), start=1):
+        if not pattern.search(line) or _JS_DECLARATION_PATTERN.match(line):
+            continue
+        initial = module_level.match(line)
+        if initial:
+            name = re.split(r"[\s:=]", line, maxsplit=1)[0]
+            if name not in declared:
+                declared.add(name)
+                continue
+        sites.append(number)
+    return sites
+
+
+def dependents(graph: Mapping[str, set[str]], targets: Iterable[str]) -> set[str]:
+    """Return every path that transitively imports one of ``targets``."""
+    reverse: dict[str, set[str]] = {}
+    for path, imports in graph.items():
+        for imported in imports:
+            reverse.setdefault(imported, set()).add(path)
+
+    found: set[str] = set()
+    pending = list(targets)
+    while pending:
+        current = pending.pop()
+        for importer in reverse.get(current, ()):
+            if importer not in found:
+                found.add(importer)
+                pending.append(importer)
+    return found
+
+
+def _js_imports(path: str, content: str, paths: set[str]) -> set[str]:
+    targets = set()
+    base = posixpath.dirname(path)
+    for specifier in _JS_IMPORT_PATTERN.findall(content):
+        if not specifier.startswith("."):
+            continue
+        resolved = _resolve_js(posixpath.normpath(posixpath.join(base, specifier)), paths)
+        if resolved:
+            targets.add(resolved)
+    return targets
+
+
+def _resolve_js(candidate: str, paths: set[str]) -> str | None:
+    if candidate in paths:
+        return candidate
+    for extension in JS_EXTENSIONS:
+        if candidate + extension in paths:
+            return candidate + extension
+    for extension in JS_EXTENSIONS:
+        index = posixpath.join(candidate, "index" + extension)
+        if index in paths:
+            return index
+    return None
+
+
+def _python_module(path: str) -> str:
+    module = path[: -len(".py")].replace("/", ".")
+    return module[: -len(".__init__")] if module.endswith(".__init__") else module
+
+
+def _python_imports(path: str, content: str, modules: dict[str, str]) -> set[str]:
+    targets = set()
+    package = _python_module(path).rsplit(".", 1)[0] if "." in _python_module(path) else ""
+    if path.endswith("__init__.py"):
+        package = _python_module(path)
+
+    for relative, names, plain in _PY_IMPORT_PATTERN.findall(content):
+        candidates = []
+        if plain:
+            candidates = [name.split(" as ")[0].strip() for name in plain.split(",")]
+        else:
+            module = relative
+            if relative.startswith("."):
+                level = len(relative) - len(relative.lstrip("."))
+                anchor = package.split(".") if package else []
+                anchor = anchor[: len(anchor) - (level - 1)] if level > 1 else anchor
+                module = ".".join(part for part in anchor + [relative.lstrip(".")] if part)
+            candidates.append(module)
+            candidates.extend(
+                f"{module}.{name.split(' as ')[0].strip()}" if module else name.split(" as ")[0].strip()
+                for name in names.split(",")
+            )
+        for candidate in candidates:
+            while candidate:
+                if candidate in modules:
+                    targets.add(modules[candidate])
+                    break
+                candidate = candidate.rpartition(".")[0]
+    return targets
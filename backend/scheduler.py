@@ -0,0 +1,194 @@
+import asyncio
+from collections import deque
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class SchedulerBusy(RuntimeError):
+    def __init__(self, priority: Priority, retry_after: float) -> None:
+        super().__init__(f"The {priority.name.lower()} queue is full; retry in {retry_after:g}s.")
+        self.retry_after = retry_after
+
+
+class Job:
+    """One scheduled run whose events are fanned out to every subscriber.
+
+    Events are kept so that a subscriber attaching late replays the run from
+    the start. ``cleanup`` runs exactly once, whether the job finishes, fails
+    or is cancelled before it starts.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        priority: Priority,
+        factory: Callable[[], AsyncIterator[dict[str, Any]]],
+        cleanup: Callable[[], Any] | None = None,
+    ) -> None:
+        self.key = key
+        self.priority = priority
+        self.factory = factory
+        self.cleanup = cleanup
+        self.events: list[dict[str, Any]] = []
+        self.finished = False
+        self.task: asyncio.Task[None] | None = None
+        self._subscribers: set[asyncio.Queue[dict[str, Any] | None]] = set()
+
+    def publish(self, event: dict[str, Any]) -> None:
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        if self.cleanup is not None:
+            self.cleanup()
+
+
+class JobScheduler:
+    """Bounded worker pool with per-priority queues and in-flight deduplication.
+
+    ``workers`` take interactive jobs before batch ones; ``interactive_workers``
+    only ever run interactive jobs, so a pool busy with long audits cannot
+    starve them. Each priority admits at most ``max_queued`` waiting jobs and
+    further submissions raise ``SchedulerBusy``. A job whose last subscriber
+    goes away is cancelled, whether it is still queued or already running.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int,
+        interactive_workers: int = 1,
+        max_queued: int = 32,
+        retry_after: float = 5.0,
+    ) -> None:
+        self.workers = workers
+        self.interactive_workers = interactive_workers
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self._queues: dict[Priority, deque[Job]] = {priority: deque() for priority in Priority}
+        self._jobs: dict[str, Job] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._workers: list[asyncio.Task[None]] = []
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "running": sum(job.task is not None for job in self._jobs.values()),
+            **{f"queued_{priority.name.lower()}": len(queue) for priority, queue in self._queues.items()},
+        }
+
+    def has_capacity(self, priority: Priority) -> bool:
+        return len(self._queues[priority]) < self.max_queued
+
+    def submit(
+        self,
+        key: str,
+        priority: Priority,
+        factory: Callable[[], AsyncIterator[dict[str, Any]]],
+        cleanup: Callable[[], Any] | None = None,
+    ) -> tuple[Job, bool]:
+        """Queue a job, or return the in-flight job with the same key.
+
+        The flag is False when an existing job was returned; ``cleanup`` is then
+        left to the caller.
+        """
+        existing = self._jobs.get(key)
+        if existing is not None and not existing.finished:
+            return existing, False
+        if not self.has_capacity(priority):
+            raise SchedulerBusy(priority, self.retry_after)
+
+        self._start()
+        job = Job(key, priority, factory, cleanup)
+        self._jobs[key] = job
+        self._queues[priority].append(job)
+        assert self._wakeup is not None
+        self._wakeup.set()
+        return job, True
+
+    async def subscribe(self, job: Job) -> AsyncIterator[dict[str, Any]]:
+        """Yield the job's events from the beginning until it finishes.
+
+        Leaving early (e.g. the client disconnected) detaches this subscriber and
+        cancels the job if nobody else is listening.
+        """
+        queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        for event in job.events:
+            queue.put_nowait(event)
+        if job.finished:
+            queue.put_nowait(None)
+        job._subscribers.add(queue)
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            job._subscribers.discard(queue)
+            if not job._subscribers and not job.finished:
+                self._cancel(job)
+
+    async def close(self) -> None:
+        for job in list(self._jobs.values()):
+            self._cancel(job)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._wakeup = None
+
+    def _start(self) -> None:
+        if self._wakeup is not None:
+            return
+        self._wakeup = asyncio.Event()
+        pools = [(Priority.INTERACTIVE, Priority.BATCH)] * self.workers
+        pools += [(Priority.INTERACTIVE,)] * self.interactive_workers
+        self._workers = [asyncio.create_task(self._work(priorities)) for priorities in pools]
+
+    def _cancel(self, job: Job) -> None:
+        # Forget the job straight away so a new submission with the same key
+        # starts afresh instead of attaching to a run that is shutting down.
+        self._forget(job)
+        if job.task is not None:
+            job.task.cancel()
+            return
+        queue = self._queues[job.priority]
+        if job in queue:
+            queue.remove(job)
+        job.finish()
+
+    def _forget(self, job: Job) -> None:
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+
+    async def _work(self, priorities: tuple[Priority, ...]) -> None:
+        assert self._wakeup is not None
+        wakeup = self._wakeup
+        while True:
+            queue = next((self._queues[priority] for priority in priorities if self._queues[priority]), None)
+            if queue is None:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            job = queue.popleft()
+            # The job runs in its own task so cancelling it leaves the worker alive.
+            job.task = asyncio.create_task(self._run(job))
+            await asyncio.wait([job.task])
+
+    async def _run(self, job: Job) -> None:
+        try:
+            async for event in job.factory():
+                job.publish(event)
+        except Exception as error:
+            job.publish({"type": "error", "message": f"{type(error).__name__}: {error}"})
+        finally:
+            self._forget(job)
+            job.finish()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterable, Iterator
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "invariant.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agent_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS agent_cache_last_used ON agent_cache (last_used);
+CREATE INDEX IF NOT EXISTS agent_cache_created_at ON agent_cache (created_at);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_snapshots (
+    run_id TEXT PRIMARY KEY,
+    manifest TEXT NOT NULL,
+    stages TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE INDEX IF NOT EXISTS run_snapshots_created_at ON run_snapshots (created_at);
+"""
+
+
+def open_database(path: str) -> sqlite3.Connection:
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(_SCHEMA)
+    _migrate(connection)
+    connection.executescript(_INDEXES)
+    return connection
+
+
+def _migrate(connection: sqlite3.Connection) -> None:
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(run_snapshots)")}
+    if "created_at" in columns:
+        return
+    try:
+        connection.execute("ALTER TABLE run_snapshots ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        return  # Another process added it first.
+    # Date existing snapshots from now so the first prune does not drop them all.
+    connection.execute("UPDATE run_snapshots SET created_at = ?", (time.time(),))
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def files_digest(files: Iterable[tuple[str, str]]) -> str:
+    digest = hashlib.sha256()
+    for path, file_hash in sorted((path, content_hash(content)) for path, content in files):
+        digest.update(path.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(file_hash.encode("ascii"))
+    return digest.hexdigest()
+
+
+class AgentCache:
+    """Content-addressed store for raw agent outputs.
+
+    Keys hash the full request payload (model, temperature, prompts) together
+    with a digest of the input files. Entries expire after ``ttl_seconds`` and
+    the least recently used ones are evicted once ``max_bytes`` is exceeded.
+    The stored byte total is kept as a running count so a ``put`` does not
+    rescan the table; it is recounted only when it crosses ``max_bytes``.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, *, max_bytes: int, ttl_seconds: float) -> None:
+        self.connection = connection
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._total = self._count_bytes()
+
+    @staticmethod
+    def key(payload: dict[str, Any], scope: str = "") -> str:
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(f"{scope}\0{canonical}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value, created_at FROM agent_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._delete(key)
+                return None
+            self.connection.execute("UPDATE agent_cache SET last_used = ? WHERE key = ?", (now, key))
+            return value
+
+    def get_many(self, keys: Iterable[str]) -> list[str | None]:
+        return [self.get(key) for key in keys]
+
+    def put(self, key: str, value: str) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, entries: Iterable[tuple[str, str]]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, value in entries:
+                size = len(value.encode("utf-8"))
+                if size > self.max_bytes:
+                    continue
+                self._delete(key)
+                self.connection.execute(
+                    "INSERT INTO agent_cache (key, value, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now),
+                )
+                self._total += size
+            self._evict(now)
+
+    def _delete(self, key: str) -> None:
+        deleted = self.connection.execute("DELETE FROM agent_cache WHERE key = ? RETURNING size", (key,)).fetchall()
+        self._total -= sum(size for (size,) in deleted)
+
+    def _count_bytes(self) -> int:
+        (total,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM agent_cache").fetchone()
+        return total
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds > 0:
+            expired = self.connection.execute(
+                "DELETE FROM agent_cache WHERE created_at < ? RETURNING size",
+                (now - self.ttl_seconds,),
+            ).fetchall()
+            self._total -= sum(size for (size,) in expired)
+        if self._total <= self.max_bytes:
+            return
+        # Other processes may share the database; recount before evicting.
+        self._total = self._count_bytes()
+        excess = self._total - self.max_bytes
+        stale = []
+        for key, size in self.connection.execute("SELECT key, size FROM agent_cache ORDER BY last_used ASC"):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+            self._total -= size
+        self.connection.executemany("DELETE FROM agent_cache WHERE key = ?", stale)
+
+
+class ResultStore:
+    """Completed runs (findings plus the streamed event log) keyed by run_id.
+
+    Runs and workspace snapshots older than ``max_age_seconds``, or beyond the
+    newest ``max_count`` of each, are pruned on save at most once every
+    ``prune_interval`` seconds, along with the blobs no remaining snapshot
+    references. A limit of zero disables it.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        *,
+        max_age_seconds: float = 0,
+        max_count: int = 0,
+        prune_interval: float = 3600,
+    ) -> None:
+        self.connection = connection
+        self.max_age_seconds = max_age_seconds
+        self.max_count = max_count
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def save(self, run_id: str, record: dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO runs (run_id, created_at, record) VALUES (?, ?, ?)",
+                (run_id, now, json.dumps(record, ensure_ascii=False)),
+            )
+            if now - self._pruned_at >= self.prune_interval:
+                self._prune(now)
+
+    def get(self, run_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self.connection.execute("SELECT record FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def save_snapshot(self, run_id: str, files: Iterable[tuple[str, str]], stages: dict[str, Any]) -> None:
+        """Keep the audited file set and reusable stage outputs for incremental re-audits."""
+        manifest = {}
+
+        def blobs() -> Iterator[tuple[str, str]]:
+            for path, content in files:
+                digest = content_hash(content)
+                manifest[path] = digest
+                yield digest, content
+
+        with self._lock:
+            self.connection.executemany("INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)", blobs())
+            now = time.time()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO run_snapshots (run_id, manifest, stages, created_at) VALUES (?, ?, ?, ?)",
+                (run_id, json.dumps(manifest), json.dumps(stages, ensure_ascii=False), now),
+            )
+            if now - self._pruned_at >= self.prune_interval:
+                self._prune(now)
+
+    def get_snapshot(self, run_id: str) -> tuple[dict[str, str], dict[str, Any]] | None:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT manifest, stages FROM run_snapshots WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1])
+
+    def get_blob(self, digest: str) -> str | None:
+        with self._lock:
+            row = self.connection.execute("SELECT content FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return None if row is None else row[0]
+
+    def prune(self) -> dict[str, int]:
+        """Apply the retention limits now; returns the number of rows removed per table."""
+        with self._lock:
+            return self._prune(time.time())
+
+    def _prune(self, now: float) -> dict[str, int]:
+        self._pruned_at = now
+        removed = {}
+        for table in ("runs", "run_snapshots"):
+            count = 0
+            if self.max_age_seconds > 0:
+                count += self.connection.execute(
+                    f"DELETE FROM {table} WHERE created_at < ?",
+                    (now - self.max_age_seconds,),
+                ).rowcount
+            if self.max_count > 0:
+                count += self.connection.execute(
+                    f"DELETE FROM {table} WHERE run_id IN "
+                    f"(SELECT run_id FROM {table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_count,),
+                ).rowcount
+            removed[table] = count
+        removed["blobs"] = 0
+        if removed["run_snapshots"]:
+            removed["blobs"] = self.connection.execute(
+                "DELETE FROM blobs WHERE hash NOT IN "
+                "(SELECT manifest.value FROM run_snapshots, json_each(run_snapshots.manifest) AS manifest)"
+            ).rowcount
+        return removed
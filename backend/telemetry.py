@@ -0,0 +1,258 @@
+"""Pipeline metrics in the Prometheus text format, plus per-run timing spans.
+
+Metrics are process-wide and rendered by ``/metrics``. A ``Trace`` collects
+the spans of one run; ``span`` records into the trace active in the current
+context (tasks created by the run inherit it) and into a histogram.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}.")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def _labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Gauge whose values are read from ``collect`` at render time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        collect: Callable[[], dict[tuple[str, ...], float]] | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def _samples(self) -> list[str]:
+        values = self.collect() if self.collect is not None else {}
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            else:
+                counts[-1] += 1
+            totals[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of a block; also usable as a function decorator."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            series = sorted((key, list(counts), totals[0]) for key, (counts, totals) in self._series.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Spans of one run, relative to when the run was submitted."""
+
+    def __init__(self, started: float | None = None) -> None:
+        self.started = time.perf_counter() if started is None else started
+        self._pending: list[dict[str, Any]] = []
+
+    def add(self, name: str, started: float, duration: float, attributes: dict[str, Any] | None = None) -> None:
+        self._pending.append(
+            {
+                "name": name,
+                "start_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **(attributes or {}),
+            }
+        )
+
+    def drain(self) -> list[dict[str, Any]]:
+        """Return the spans finished since the previous call."""
+        spans, self._pending = self._pending, []
+        return spans
+
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, histogram: Histogram | None = None, **labels: str) -> Iterator[dict[str, Any]]:
+    """Time a block into ``histogram`` and the current trace.
+
+    The yielded dict is copied into the span, so the block can attach
+    attributes such as byte counts. A block that raises gets an ``error``
+    attribute.
+    """
+    attributes: dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as error:
+        attributes["error"] = type(error).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        if histogram is not None:
+            histogram.observe(duration, **labels)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(name, started, duration, attributes)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram("invariant_stage_seconds", "Wall time of each pipeline stage.", ("stage",))
+)
+JOB_QUEUE_SECONDS: Histogram = REGISTRY.register(
+    Histogram("invariant_job_queue_seconds", "Time a job waited in the scheduler queue.", ("priority",))
+)
+JOB_SECONDS: Histogram = REGISTRY.register(
+    Histogram("invariant_job_seconds", "Run time of a scheduled job, excluding queueing.", ("priority",))
+)
+AGENT_SECONDS: Histogram = REGISTRY.register(
+    Histogram("invariant_agent_seconds", "Wall time of K2 agent calls that missed the cache.", ("agent",))
+)
+AGENT_FIRST_TOKEN_SECONDS: Histogram = REGISTRY.register(
+    Histogram("invariant_agent_first_token_seconds", "Time until a K2 agent call returned content.", ("agent",))
+)
+PARSE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "invariant_parse_seconds",
+        "Time spent parsing and normalising agent output.",
+        ("step",),
+        buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+    )
+)
+AGENT_CACHE_TOTAL: Counter = REGISTRY.register(
+    Counter("invariant_agent_cache_total", "Agent cache lookups.", ("agent", "result"))
+)
+AGENT_BYTES_TOTAL: Counter = REGISTRY.register(
+    Counter("invariant_agent_bytes_total", "Bytes sent to and received from K2.", ("agent", "direction"))
+)
+AGENT_TOKENS_TOTAL: Counter = REGISTRY.register(
+    Counter(
+        "invariant_agent_tokens_total",
+        "Prompt and completion tokens, as reported by K2 or estimated at 4 characters per token.",
+        ("agent", "kind"),
+    )
+)
+AGENT_RETRIES_TOTAL: Counter = REGISTRY.register(
+    Counter("invariant_agent_retries_total", "K2 requests retried after a transient failure.", ("agent",))
+)
+AGENT_ERRORS_TOTAL: Counter = REGISTRY.register(
+    Counter("invariant_agent_errors_total", "K2 agent calls that failed.", ("agent",))
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
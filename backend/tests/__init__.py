@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# backend.main opens its database on import; keep the tests off the real one.
+_database = tempfile.NamedTemporaryFile(prefix="invariant-tests-", suffix=".sqlite3", delete=False)
+_database.close()
+os.environ["INVARIANT_DB_PATH"] = _database.name
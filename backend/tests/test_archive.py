@@ -0,0 +1,193 @@
+import io
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from typing import IO, AsyncIterator
+
+from backend.archive import ArchiveError, ArchiveLimits, ArchiveWorkspace, spool_multipart
+
+try:
+    import python_multipart
+except ImportError:
+    python_multipart = None
+
+LIMITS = ArchiveLimits(max_upload_bytes=1 << 20, max_files=100, max_file_bytes=4096, max_total_bytes=1 << 16)
+
+FILES = {
+    "repo-main/src/app.js": b"export const state = {};\n",
+    "repo-main/src/deep/util.py": "def café():\n    return '✓'\n".encode("utf-8"),
+    "repo-main/README.md": b"# Demo\n",
+}
+
+
+def build_tar(files: dict[str, bytes], mode: str = "w:gz") -> IO[bytes]:
+    spool = tempfile.TemporaryFile()
+    with tarfile.open(fileobj=spool, mode=mode) as archive:
+        directory = tarfile.TarInfo(next(iter(files)).rpartition("/")[0])
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    spool.seek(0)
+    return spool
+
+
+def build_zip(files: dict[str, bytes]) -> IO[bytes]:
+    spool = tempfile.TemporaryFile()
+    with zipfile.ZipFile(spool, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(next(iter(files)).rpartition("/")[0] + "/", b"")
+        for name, data in files.items():
+            archive.writestr(name, data)
+    spool.seek(0)
+    return spool
+
+
+BUILDERS = {
+    "zip": build_zip,
+    "tar": lambda files: build_tar(files, "w"),
+    "tar.gz": lambda files: build_tar(files, "w:gz"),
+    "tar.bz2": lambda files: build_tar(files, "w:bz2"),
+    "tar.xz": lambda files: build_tar(files, "w:xz"),
+}
+
+
+def open_workspace(kind: str, files: dict[str, bytes], limits: ArchiveLimits = LIMITS) -> ArchiveWorkspace:
+    return ArchiveWorkspace(BUILDERS[kind](files), limits)
+
+
+class ArchiveWorkspaceTests(unittest.TestCase):
+    def test_formats_unpack_to_the_same_workspace(self) -> None:
+        expected = {name.removeprefix("repo-main/"): data.decode("utf-8") for name, data in FILES.items()}
+        for kind in BUILDERS:
+            with self.subTest(kind=kind):
+                workspace = open_workspace(kind, FILES)
+                try:
+                    self.assertEqual(dict(workspace), expected)
+                finally:
+                    workspace.close()
+
+    def test_keeps_paths_without_a_single_top_level_directory(self) -> None:
+        files = {"a/x.js": b"1", "b/y.js": b"2", "top.js": b"3"}
+        for kind in ("zip", "tar.gz"):
+            with self.subTest(kind=kind):
+                workspace = open_workspace(kind, files)
+                self.assertEqual(sorted(workspace), ["a/x.js", "b/y.js", "top.js"])
+                workspace.close()
+
+    def test_normalises_member_paths(self) -> None:
+        workspace = open_workspace("tar.gz", {"repo/./src/../lib/a.js": b"a", "repo/b.js": b"b"})
+        self.assertEqual(sorted(workspace), ["b.js", "lib/a.js"])
+        workspace.close()
+
+    def test_rejects_members_that_escape_the_root(self) -> None:
+        for name in ("../evil.js", "repo/../../evil.js", "/etc/passwd", "..\\evil.js"):
+            for kind in ("zip", "tar.gz"):
+                with self.subTest(name=name, kind=kind), self.assertRaises(ArchiveError) as raised:
+                    open_workspace(kind, {"repo/ok.js": b"ok", name: b"x"})
+                self.assertEqual(raised.exception.status, 422)
+
+    def test_skips_binary_and_oversized_files(self) -> None:
+        files = {
+            "repo/ok.js": b"ok",
+            "repo/logo.png": b"\x89PNG\r\n\x1a\n\0\0\0",
+            "repo/latin1.txt": "naïve latin-1 text".encode("latin-1"),
+            "repo/big.js": b"x" * (LIMITS.max_file_bytes + 1),
+        }
+        for kind in ("zip", "tar.gz"):
+            with self.subTest(kind=kind):
+                workspace = open_workspace(kind, files)
+                self.assertEqual(list(workspace), ["ok.js"])
+                self.assertEqual((workspace.skipped_binary, workspace.skipped_large), (2, 1))
+                workspace.close()
+
+    def test_character_split_at_the_sniff_boundary_is_text(self) -> None:
+        data = b"a" * 8191 + "✓".encode("utf-8")
+        limits = LIMITS.model_copy(update={"max_file_bytes": 1 << 14})
+        workspace = open_workspace("tar.gz", {"repo/wide.txt": data}, limits)
+        self.assertEqual(workspace["wide.txt"], data.decode("utf-8"))
+        workspace.close()
+
+    def test_too_many_files_is_413(self) -> None:
+        limits = LIMITS.model_copy(update={"max_files": 2})
+        for kind in ("zip", "tar.gz"):
+            with self.subTest(kind=kind), self.assertRaises(ArchiveError) as raised:
+                open_workspace(kind, {f"repo/{n}.js": b"x" for n in range(3)}, limits)
+            self.assertEqual(raised.exception.status, 413)
+
+    def test_too_much_text_is_413(self) -> None:
+        limits = LIMITS.model_copy(update={"max_total_bytes": 5000})
+        for kind in ("zip", "tar.gz"):
+            with self.subTest(kind=kind), self.assertRaises(ArchiveError) as raised:
+                open_workspace(kind, {f"repo/{n}.js": b"x" * 2000 for n in range(3)}, limits)
+            self.assertEqual(raised.exception.status, 413)
+
+    def test_decompression_bomb_is_413(self) -> None:
+        limits = LIMITS.model_copy(update={"max_total_bytes": 1000, "max_file_bytes": 1 << 20})
+        with self.assertRaises(ArchiveError) as raised:
+            open_workspace("tar.gz", {"repo/zeros.txt": b"0" * (1 << 20)}, limits)
+        self.assertEqual(raised.exception.status, 413)
+
+    def test_rejects_empty_and_unreadable_uploads(self) -> None:
+        for content in (b"", b"not an archive at all" * 100, b"\x1f\x8bbroken gzip"):
+            with self.subTest(content=content[:10]), self.assertRaises(ArchiveError) as raised:
+                spool = tempfile.TemporaryFile()
+                spool.write(content)
+                ArchiveWorkspace(spool, LIMITS)
+            self.assertEqual(raised.exception.status, 422)
+
+    def test_rejects_archives_without_text_files(self) -> None:
+        with self.assertRaises(ArchiveError):
+            open_workspace("zip", {"repo/logo.png": b"\0\0\0"})
+
+
+async def chunked(body: bytes, size: int = 7) -> AsyncIterator[bytes]:
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+def multipart(parts: list[tuple[str, str | None, bytes]], boundary: str = "XyZ") -> tuple[bytes, str]:
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+@unittest.skipIf(python_multipart is None, "python-multipart is not installed")
+class SpoolMultipartTests(unittest.IsolatedAsyncioTestCase):
+    async def test_spools_the_archive_and_keeps_other_fields(self) -> None:
+        archive = build_zip(FILES).read()
+        body, content_type = multipart([("workspace_name", None, b"demo"), ("archive", "repo.zip", archive)])
+        upload = await spool_multipart(chunked(body), content_type, LIMITS)
+        try:
+            self.assertEqual(upload.filename, "repo.zip")
+            self.assertEqual(upload.fields, {"workspace_name": "demo"})
+            self.assertEqual(upload.file.read(), archive)
+        finally:
+            upload.file.close()
+
+    async def test_oversized_upload_is_413(self) -> None:
+        body, content_type = multipart([("archive", "big.zip", b"x" * 2048)])
+        limits = LIMITS.model_copy(update={"max_upload_bytes": 1024})
+        with self.assertRaises(ArchiveError) as raised:
+            await spool_multipart(chunked(body, 256), content_type, limits)
+        self.assertEqual(raised.exception.status, 413)
+
+    async def test_rejects_uploads_without_an_archive(self) -> None:
+        body, content_type = multipart([("workspace_name", None, b"demo")])
+        with self.assertRaises(ArchiveError) as raised:
+            await spool_multipart(chunked(body), content_type, LIMITS)
+        self.assertEqual(raised.exception.status, 422)
+
+    async def test_rejects_other_content_types(self) -> None:
+        with self.assertRaises(ArchiveError) as raised:
+            await spool_multipart(chunked(b"{}"), "application/json", LIMITS)
+        self.assertEqual(raised.exception.status, 415)
+
+
+if __name__ == "__main__":
+    unittest.main()
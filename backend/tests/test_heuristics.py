@@ -0,0 +1,115 @@
+import unittest
+
+from backend.heuristics import (
+    DEFAULT_RULE_PACK,
+    Rule,
+    RuleEngine,
+    _legacy_scan,
+    _synthetic_workspace,
+    strip_js_comments,
+)
+
+
+def rule(rule_id: str, pattern: str, **conditions: list[str]) -> Rule:
+    return Rule(
+        id=rule_id,
+        error_name=rule_id,
+        explanation="x",
+        roast_summary="x",
+        recommendation="x",
+        pattern=pattern,
+        **conditions,
+    )
+
+
+class RuleEngineTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.engine = RuleEngine.from_pack(DEFAULT_RULE_PACK)
+
+    def lines(self, content: str, path: str = "src/a.js") -> list[int]:
+        return [line for line, rule_id in self.engine.scan(path, content) if rule_id == "unconditional-success"]
+
+    def test_skips_anchors_in_comments_and_strings(self) -> None:
+        cases = {
+            "line comment": "x(); // return true",
+            "single quotes": "const s = 'return true';",
+            "double quotes": 'const s = "return true";',
+            "escaped quote": 'const s = "\\" return true";',
+            "template": "const s = `return true`;",
+            "regex literal": "const re = /return true/;",
+        }
+        for name, content in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.lines(content), [])
+
+    def test_skips_anchors_in_multi_line_comments_and_templates(self) -> None:
+        content = (
+            "/* disabled:\n"
+            "   return true\n"
+            "*/\n"
+            "const help = `\n"
+            "  return true\n"
+            "`;\n"
+            "return true\n"
+        )
+        self.assertEqual(self.lines(content), [7])
+
+    def test_quotes_in_regex_literals_do_not_open_strings(self) -> None:
+        cases = {
+            "after =": "const re = /'/; return true",
+            "character class": "const ok = /[/\"']/.test(s); return true",
+            "after return": "function f() { return /'/.test(s) }; return true",
+            "division": "const half = total / 2; const q = a / b; return true",
+            "unterminated quote": "const s = it's; return true",
+        }
+        for name, content in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.lines(content), [1])
+
+    def test_line_numbers_count_skipped_matches(self) -> None:
+        content = "// return true\nx();\n'return true';\n\nreturn true\n/* a\nb */ return true\n"
+        self.assertEqual(self.lines(content), [5, 7])
+        self.assertEqual(self.lines(content.replace("/* a\nb */", "/* a b */")), [5, 6])
+
+    def test_non_js_files_are_scanned_as_plain_text(self) -> None:
+        self.assertEqual(self.lines("# return true\n", "tool.py"), [1])
+
+    def test_requires_and_excludes_check_the_line_without_comments(self) -> None:
+        engine = RuleEngine(
+            [
+                rule("grant", r"grant\(", requires=["admin", "user"], excludes=[r"\bcheck\(", "audit"]),
+                rule("grant-ts", r"grant\(", extensions=[".ts"]),
+            ]
+        )
+        content = (
+            "grant(admin, user)\n"
+            "grant(admin)\n"
+            "check(x); grant(admin, user)\n"
+            "grant(user) // admin\n"
+            "grant(admin, user) /* audit */\n"
+        )
+        self.assertEqual(engine.scan("a.js", content), [(1, "grant"), (5, "grant")])
+        self.assertEqual(
+            [hit for hit in engine.scan("a.ts", content) if hit[1] == "grant-ts"],
+            [(line, "grant-ts") for line in range(1, 6)],
+        )
+
+    def test_hits_are_ordered_by_line_then_rule(self) -> None:
+        content = "if (admin) return true\nreturn true // admin\nif (x) {}\nreturn true; admin()\n"
+        self.assertEqual(
+            self.engine.scan("a.js", content),
+            [(1, "role-shortcut"), (2, "unconditional-success"), (4, "unconditional-success"), (4, "role-shortcut")],
+        )
+
+    def test_strip_js_comments_keeps_strings_and_regex_literals(self) -> None:
+        self.assertEqual(strip_js_comments("a / b // note"), "a / b ")
+        self.assertEqual(strip_js_comments("s = '//'; r = /x/; /* c */ y"), "s = '//'; r = /x/;  y")
+
+    def test_matches_the_legacy_scanner_on_the_playground(self) -> None:
+        files = _synthetic_workspace(2)
+        self.assertGreater(len(_legacy_scan(files)), 0)
+        self.assertEqual(sorted(self.engine.scan_files(files)), sorted(_legacy_scan(files)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import os
+import unittest
+from typing import Any
+from unittest import mock
+
+from fastapi import HTTPException
+
+from backend import main
+from backend.incremental import merge_findings, merge_stage_output
+from backend.repo_index import build_import_graph, dependents
+from backend.store import ResultStore, content_hash, open_database
+
+WORKSPACE = {
+    "src/config.js": "export const limits = { max: 5 };\n",
+    "src/cart.js": "import { limits } from './config';\nexport function add() {}\n",
+    "src/checkout.js": "import { add } from './cart';\nexport function pay() {}\n",
+    "src/report.js": "export function render() {}\n",
+    "README.md": "# Shop\n",
+}
+
+
+def finding(path: str, name: str = "Prior flaw") -> dict[str, Any]:
+    return {
+        "error_name": name,
+        "explanation": "x",
+        "location": f"{path}:1",
+        "roast_summary": "x",
+        "recommendation": "x",
+    }
+
+
+class DependentsTests(unittest.TestCase):
+    def test_follows_importers_transitively(self) -> None:
+        graph = build_import_graph(WORKSPACE)
+        self.assertEqual(dependents(graph, ["src/config.js"]), {"src/cart.js", "src/checkout.js"})
+        self.assertEqual(dependents(graph, ["src/checkout.js"]), set())
+        self.assertEqual(dependents(graph, ["src/report.js"]), set())
+
+    def test_terminates_on_import_cycles(self) -> None:
+        graph = {"a.js": {"b.js"}, "b.js": {"a.js"}, "c.js": {"a.js"}}
+        self.assertEqual(dependents(graph, ["a.js"]), {"a.js", "b.js", "c.js"})
+
+
+class MergeTests(unittest.TestCase):
+    def test_merge_findings_replaces_only_reanalysed_files(self) -> None:
+        prior = [finding("src/cart.js"), finding("src/report.js"), finding("src/gone.js")]
+        fresh = [finding("src/cart.js", "Fresh flaw")]
+        merged = merge_findings(prior, fresh, {"src/cart.js", "src/gone.js"})
+        self.assertEqual(
+            [(item["error_name"], item["location"]) for item in merged],
+            [("Prior flaw", "src/report.js:1"), ("Fresh flaw", "src/cart.js:1")],
+        )
+
+    def test_merge_findings_matches_paths_with_colons_and_no_line(self) -> None:
+        prior = [finding("C:/repo/a.js"), {**finding("b.js"), "location": "b.js"}]
+        self.assertEqual(merge_findings(prior, [], {"C:/repo/a.js", "b.js"}), [])
+
+    def test_fresh_finding_replaces_an_identical_prior_one(self) -> None:
+        prior = [finding("src/report.js")]
+        fresh = [{**finding("src/report.js"), "explanation": "updated"}]
+        self.assertEqual(merge_findings(prior, fresh, set()), fresh)
+
+    def test_merge_stage_output_drops_entries_for_every_reanalysed_file(self) -> None:
+        prior = {
+            "modules": {"src/cart.js": "cart", "src/checkout.js": "checkout", "src/report.js": "report"},
+            "state_flows": [{"from": "src/config.js", "to": "src/cart.js"}, {"from": "src/report.js", "to": "stdout"}],
+            "summary": "old",
+        }
+        update = {"modules": {"src/config.js": "config v2"}, "state_flows": [{"from": "src/config.js", "to": "x"}]}
+        merged = merge_stage_output(prior, update, {"src/config.js", "src/cart.js", "src/checkout.js"})
+        self.assertEqual(
+            merged,
+            {
+                "modules": {"src/report.js": "report", "src/config.js": "config v2"},
+                "state_flows": [{"from": "src/report.js", "to": "stdout"}, {"from": "src/config.js", "to": "x"}],
+                "summary": "old",
+            },
+        )
+
+    def test_merge_stage_output_takes_new_scalars_and_keys(self) -> None:
+        merged = merge_stage_output({"summary": "old", "modules": {}}, {"summary": "new", "risks": ["r"]}, set())
+        self.assertEqual(merged, {"summary": "new", "modules": {}, "risks": ["r"]})
+
+
+class DeltaTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        connection = open_database(":memory:")
+        self.addCleanup(connection.close)
+        self.store = ResultStore(connection)
+        patches = [
+            mock.patch.object(main, "result_store", self.store),
+            mock.patch.dict(os.environ, {"K2_API_KEY": ""}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store.save_snapshot("base", WORKSPACE.items(), {"cartographer": {"modules": {}}})
+        self.store.save("base", {"findings": [finding(path) for path in sorted(WORKSPACE) if path.endswith(".js")]})
+
+    def request(
+        self, changed: dict[str, str | None] | None = None, removed: list[str] | None = None, **hashes: str
+    ) -> main.RepoDeltaAuditRequest:
+        return main.RepoDeltaAuditRequest(
+            base_run_id="base",
+            changed=[
+                {"path": path, "sha256": hashes.get(path) or content_hash(content or ""), "content": content}
+                for path, content in (changed or {}).items()
+            ],
+            removed=removed or [],
+        )
+
+
+class ResolveDeltaTests(DeltaTestCase):
+    def test_applies_changes_and_removals_to_the_stored_workspace(self) -> None:
+        delta = main.resolve_delta(
+            self.request({"src/config.js": "export const limits = { max: 9 };\n", "src/new.js": "x\n"}, ["src/report.js"])
+        )
+        files = {file.path: file.content for file in delta.files}
+        self.assertEqual(sorted(files), ["README.md", "src/cart.js", "src/checkout.js", "src/config.js", "src/new.js"])
+        self.assertEqual(files["src/config.js"], "export const limits = { max: 9 };\n")
+        self.assertEqual((delta.changed, delta.removed), (["src/config.js", "src/new.js"], ["src/report.js"]))
+        self.assertEqual(delta.stages, {"cartographer": {"modules": {}}})
+        self.assertEqual(len(delta.prior_findings), 4)
+
+    def test_changes_can_reference_stored_content_by_hash(self) -> None:
+        cart = WORKSPACE["src/cart.js"]
+        delta = main.resolve_delta(self.request({"src/moved.js": None}, **{"src/moved.js": content_hash(cart)}))
+        self.assertEqual({file.path: file.content for file in delta.files}["src/moved.js"], cart)
+
+    def test_resending_an_unchanged_file_is_not_a_change(self) -> None:
+        delta = main.resolve_delta(self.request({"src/report.js": WORKSPACE["src/report.js"]}))
+        self.assertEqual(delta.changed, [])
+
+    def test_ignores_removals_of_unknown_paths(self) -> None:
+        self.assertEqual(main.resolve_delta(self.request(removed=["nope.js"])).removed, [])
+
+    def test_rejects_bad_requests(self) -> None:
+        cases = {
+            "unknown hash": (self.request({"x.js": None}, **{"x.js": "0" * 64}), 422),
+            "hash mismatch": (self.request({"x.js": "new"}, **{"x.js": content_hash("old")}), 422),
+            "removes everything": (self.request(removed=list(WORKSPACE)), 422),
+            "unknown base": (self.request().model_copy(update={"base_run_id": "nope"}), 404),
+        }
+        for name, (request, status) in cases.items():
+            with self.subTest(name), self.assertRaises(HTTPException) as raised:
+                main.resolve_delta(request)
+            self.assertEqual(raised.exception.status_code, status)
+
+
+class DeltaPipelineTests(DeltaTestCase):
+    async def run_delta(self, request: main.RepoDeltaAuditRequest) -> tuple[list[str], dict[str, Any]]:
+        analysed: list[str] = []
+
+        def heuristics(contents: dict[str, str]) -> list[main.Finding]:
+            analysed.extend(sorted(contents))
+            return main.normalize_findings([finding(path, "Fresh flaw") for path in contents])
+
+        with mock.patch.object(main, "heuristic_findings", heuristics):
+            events = [event async for event in main.run_delta_pipeline(main.resolve_delta(request))]
+        return analysed, events[-1]
+
+    def names_by_path(self, done: dict[str, Any]) -> dict[str, str]:
+        return {item["location"].rpartition(":")[0]: item["error_name"] for item in done["findings"]}
+
+    async def test_reanalyses_changed_and_dependent_files_and_keeps_other_findings(self) -> None:
+        analysed, done = await self.run_delta(
+            self.request({"src/config.js": "export const limits = { max: 9 };\n"}, ["src/report.js"])
+        )
+        self.assertEqual(analysed, ["src/cart.js", "src/checkout.js", "src/config.js"])
+        self.assertEqual(
+            self.names_by_path(done),
+            {"src/cart.js": "Fresh flaw", "src/checkout.js": "Fresh flaw", "src/config.js": "Fresh flaw"},
+        )
+        self.assertEqual(done["summary"]["base_run_id"], "base")
+        self.assertIsNotNone(self.store.get_snapshot(done["summary"]["run_id"]))
+
+    async def test_leaf_change_keeps_every_other_prior_finding(self) -> None:
+        analysed, done = await self.run_delta(self.request({"src/report.js": "export function render(x) {}\n"}))
+        self.assertEqual(analysed, ["src/report.js"])
+        self.assertEqual(
+            self.names_by_path(done),
+            {
+                "src/cart.js": "Prior flaw",
+                "src/checkout.js": "Prior flaw",
+                "src/config.js": "Prior flaw",
+                "src/report.js": "Fresh flaw",
+            },
+        )
+
+    async def test_removed_importer_drops_its_findings_only(self) -> None:
+        analysed, done = await self.run_delta(self.request(removed=["src/checkout.js"]))
+        self.assertEqual(analysed, [])
+        self.assertEqual(sorted(self.names_by_path(done)), ["src/cart.js", "src/config.js", "src/report.js"])
+
+
+if __name__ == "__main__":
+    unittest.main()
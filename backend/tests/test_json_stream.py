@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from backend.json_stream import JsonArrayStream
+
+DOCUMENTS = {
+    "plain": '{"candidate_findings": [{"error_name": "a", "confidence": 0.9}, {"error_name": "b"}]}',
+    "escaped quotes": (
+        '{"candidate_findings": [{"explanation": "says \\"hi\\" then \\\\", "location": "x.js:1"}, '
+        '{"explanation": "\\\\\\"", "n": 2}]}'
+    ),
+    "brackets in strings": (
+        '{"candidate_findings": [{"proof": "if (a[0] == \'}\') { return [1]; }", "k": ":"}, '
+        '{"proof": "]]}}{{[[", "nested": {"deep": [{"x": "]"}]}}]}'
+    ),
+    "fence and prose": (
+        'Here is the analysis you asked for.\n```json\n'
+        '{"candidate_findings": [{"error_name": "fenced"}, {"error_name": "second"}]}\n```\n'
+        'Let me know if {you} need [more].'
+    ),
+    "nested keys with the same name": (
+        '{"meta": {"candidate_findings": [{"error_name": "not me"}]}, '
+        '"note": "candidate_findings", '
+        '"candidate_findings": [{"candidate_findings": [{"error_name": "inner"}]}, [1, 2]], '
+        '"after": [{"error_name": "ignored"}]}'
+    ),
+    "scalars and whitespace": '{ "candidate_findings" :\n [ 1, "two", {"three": 3} , null, [ ] ] }',
+    "trailing object": '{"candidate_findings": [{"a": 1}]}\n{"candidate_findings": [{"b": 2}]}',
+}
+
+
+def expected(document: str) -> list:
+    start = document.index("{")
+    parsed, _ = json.JSONDecoder().raw_decode(document[start:])
+    return [item for item in parsed["candidate_findings"] if isinstance(item, (dict, list))]
+
+
+def feed_all(chunks: list[str]) -> list:
+    stream = JsonArrayStream("candidate_findings")
+    items = []
+    for chunk in chunks:
+        items.extend(stream.feed(chunk))
+    return items
+
+
+class JsonArrayStreamTests(unittest.TestCase):
+    def test_every_single_chunk_boundary(self) -> None:
+        for name, document in DOCUMENTS.items():
+            want = expected(document)
+            for cut in range(len(document) + 1):
+                with self.subTest(document=name, cut=cut):
+                    self.assertEqual(feed_all([document[:cut], document[cut:]]), want)
+
+    def test_one_character_at_a_time(self) -> None:
+        for name, document in DOCUMENTS.items():
+            with self.subTest(document=name):
+                self.assertEqual(feed_all(list(document)), expected(document))
+
+    def test_elements_are_returned_as_soon_as_they_close(self) -> None:
+        stream = JsonArrayStream("candidate_findings")
+        self.assertEqual(stream.feed('{"candidate_findings": [{"a": 1}'), [{"a": 1}])
+        self.assertEqual(stream.feed(', {"b": "}"'), [])
+        self.assertEqual(stream.feed("}"), [{"b": "}"}])
+        self.assertEqual(stream.feed("]}"), [])
+
+    def test_ignores_input_after_the_object_closes(self) -> None:
+        stream = JsonArrayStream("candidate_findings")
+        self.assertEqual(stream.feed('{"candidate_findings": []}'), [])
+        self.assertEqual(stream.feed('{"candidate_findings": [{"late": true}]}'), [])
+
+    def test_skips_malformed_elements(self) -> None:
+        self.assertEqual(feed_all(['{"candidate_findings": [{"a": }, {"b": 2}]}']), [{"b": 2}])
+
+    def test_buffer_does_not_hold_completed_elements(self) -> None:
+        stream = JsonArrayStream("candidate_findings")
+        stream.feed('{"candidate_findings": [')
+        for _ in range(1000):
+            stream.feed('{"explanation": "' + "x" * 100 + '"}, ')
+        self.assertLess(len(stream._buffer), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
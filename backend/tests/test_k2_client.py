@@ -0,0 +1,296 @@
+import asyncio
+import json
+import random
+import re
+import unittest
+from typing import Any
+
+from backend.fake_k2 import FakeK2Server, canned_content
+from backend.k2_client import K2Client, K2RequestError
+
+PAYLOAD = {
+    "model": "test",
+    "messages": [{"role": "system", "content": "You are The Adversary."}, {"role": "user", "content": "x"}],
+}
+
+
+def http_response(status: int, body: bytes, *headers: str) -> bytes:
+    head = [f"HTTP/1.1 {status} Status", f"Content-Length: {len(body)}", *headers]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+def completion(content: str) -> bytes:
+    return json.dumps({"choices": [{"message": {"content": content}}]}).encode("utf-8")
+
+
+class ScriptedServer:
+    """Answers each request with the next scripted response; ``None`` drops the connection unanswered.
+
+    A response carrying ``Connection: close`` is followed by closing the connection.
+    """
+
+    def __init__(self, responses: list[bytes | None]) -> None:
+        self.responses = list(responses)
+        self.connections = 0
+        self.requests = 0
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def __aenter__(self) -> "ScriptedServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}/v1/chat/completions"
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        for writer in self._writers:
+            writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.append(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = re.search(rb"(?i)content-length: *(\d+)", head)
+                await reader.readexactly(int(length.group(1)) if length else 0)
+                self.requests += 1
+                response = self.responses.pop(0)
+                if response is None:
+                    break
+                writer.write(response)
+                await writer.drain()
+                if b"connection: close" in response.partition(b"\r\n\r\n")[0].lower():
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeServerTests(unittest.IsolatedAsyncioTestCase):
+    async def start(self, **options: Any) -> FakeK2Server:
+        server = FakeK2Server(**options)
+        await server.start()
+        self.addAsyncCleanup(server.close)
+        return server
+
+    def client(self, url: str, **options: Any) -> K2Client:
+        self.retries: list[K2RequestError] = []
+        options.setdefault("backoff_base", 0.001)
+        client = K2Client(url, on_retry=lambda agent, error: self.retries.append(error), **options)
+        self.addAsyncCleanup(client.aclose)
+        return client
+
+    async def test_reuses_keep_alive_connections(self) -> None:
+        server = await self.start()
+        client = self.client(server.url)
+        for _ in range(5):
+            body = await client.chat_completion(PAYLOAD, "key", "Adversary")
+            self.assertEqual(body["choices"][0]["message"]["content"], canned_content(PAYLOAD))
+        self.assertEqual((server.requests_served, server.connections_opened), (5, 1))
+
+    async def test_pool_size_bounds_idle_connections(self) -> None:
+        server = await self.start(latency=0.05)
+        client = self.client(server.url, pool_size=2)
+        await asyncio.gather(*(client.chat_completion(PAYLOAD, "key", "Adversary") for _ in range(4)))
+        await asyncio.gather(*(client.chat_completion(PAYLOAD, "key", "Adversary") for _ in range(4)))
+        self.assertEqual(server.connections_opened, 6)
+
+    async def test_streams_chunked_server_sent_events(self) -> None:
+        server = await self.start(chunk_chars=3)
+        client = self.client(server.url)
+        for _ in range(2):
+            deltas = [delta async for delta in client.stream_chat_completion(PAYLOAD, "key", "Adversary")]
+            self.assertGreater(len(deltas), 10)
+            self.assertEqual("".join(deltas), canned_content(PAYLOAD))
+        self.assertEqual(server.connections_opened, 1)
+
+    async def test_gives_up_after_max_retries_on_503(self) -> None:
+        server = await self.start(error_rate=1.0)
+        client = self.client(server.url, max_retries=3)
+        with self.assertRaises(K2RequestError) as raised:
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(raised.exception.status, 503)
+        self.assertEqual(len(self.retries), 3)
+        self.assertEqual(server.errors_served, 4)
+
+        with self.assertRaises(K2RequestError):
+            async for _ in client.stream_chat_completion(PAYLOAD, "key", "Adversary"):
+                pass
+        self.assertEqual(server.errors_served, 8)
+
+    async def test_retries_intermittent_503s_until_success(self) -> None:
+        random.seed(7)
+        server = await self.start(error_rate=0.5)
+        client = self.client(server.url, max_retries=20)
+        for _ in range(10):
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+            deltas = [delta async for delta in client.stream_chat_completion(PAYLOAD, "key", "Adversary")]
+            self.assertEqual("".join(deltas), canned_content(PAYLOAD))
+        self.assertGreater(server.errors_served, 0)
+        self.assertEqual(len(self.retries), server.errors_served)
+        self.assertEqual(server.requests_served, 20)
+
+    async def test_deadline_starts_once_a_slot_is_free(self) -> None:
+        server = await self.start(latency=0.2)
+        client = self.client(server.url, max_concurrency=1, timeout=0.5)
+        await asyncio.gather(*(client.chat_completion(PAYLOAD, "key", "Adversary") for _ in range(4)))
+
+        impatient = self.client(server.url, max_concurrency=1, acquire_timeout=0.1)
+        results = await asyncio.gather(
+            *(impatient.chat_completion(PAYLOAD, "key", "Adversary") for _ in range(2)), return_exceptions=True
+        )
+        self.assertIsInstance(results[0], dict)
+        self.assertIn("free K2 request slot", str(results[1]))
+
+    async def test_times_out_a_slow_server(self) -> None:
+        server = await self.start(latency=1.0)
+        client = self.client(server.url, timeout=0.1)
+        with self.assertRaisesRegex(K2RequestError, "timed out"):
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+
+
+class ScriptedServerTests(unittest.IsolatedAsyncioTestCase):
+    def client(self, url: str, **options: Any) -> K2Client:
+        self.retries: list[K2RequestError] = []
+        options.setdefault("backoff_base", 0.001)
+        client = K2Client(url, on_retry=lambda agent, error: self.retries.append(error), **options)
+        self.addAsyncCleanup(client.aclose)
+        return client
+
+    async def test_honours_retry_after(self) -> None:
+        responses = [http_response(429, b"slow down", "Retry-After: 0.3"), http_response(200, completion("ok"))]
+        async with ScriptedServer(responses) as server:
+            client = self.client(server.url)
+            started = asyncio.get_running_loop().time()
+            body = await client.chat_completion(PAYLOAD, "key", "Adversary")
+            elapsed = asyncio.get_running_loop().time() - started
+        self.assertEqual(body["choices"][0]["message"]["content"], "ok")
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertEqual([error.retry_after for error in self.retries], [0.3])
+
+    async def test_caps_retry_after_at_backoff_max(self) -> None:
+        responses = [http_response(503, b"", "Retry-After: 600"), http_response(200, completion("ok"))]
+        async with ScriptedServer(responses) as server:
+            client = self.client(server.url, backoff_max=0.05)
+            await asyncio.wait_for(client.chat_completion(PAYLOAD, "key", "Adversary"), 1)
+
+    async def test_does_not_retry_client_errors(self) -> None:
+        async with ScriptedServer([http_response(401, b"bad key")]) as server:
+            client = self.client(server.url)
+            with self.assertRaises(K2RequestError) as raised:
+                await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(raised.exception.status, 401)
+        self.assertEqual((self.retries, server.requests), ([], 1))
+
+    async def test_backoff_grows_exponentially_up_to_the_cap(self) -> None:
+        client = self.client("http://127.0.0.1:1/", backoff_base=1.0, backoff_max=5.0)
+        random.seed(3)
+        for attempt, ceiling in enumerate([1.0, 2.0, 4.0, 5.0, 5.0]):
+            delays = [client._backoff(attempt, None) for _ in range(200)]
+            self.assertLessEqual(max(delays), ceiling)
+            self.assertGreater(max(delays), ceiling * 0.8)
+        self.assertEqual(client._backoff(0, 2.5), 2.5)
+
+    async def test_retries_a_stale_keep_alive_socket_on_a_fresh_one(self) -> None:
+        ok = http_response(200, completion("ok"), "Connection: keep-alive")
+        async with ScriptedServer([ok, None, ok]) as server:
+            client = self.client(server.url)
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+            body = await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(body["choices"][0]["message"]["content"], "ok")
+        self.assertEqual((server.connections, server.requests), (2, 3))
+        self.assertEqual(self.retries, [], "a stale socket is not a failed attempt")
+
+    async def test_fresh_connection_dropped_before_response_is_retried(self) -> None:
+        async with ScriptedServer([None, http_response(200, completion("ok"))]) as server:
+            client = self.client(server.url)
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(len(self.retries), 1)
+        self.assertIsNone(self.retries[0].status)
+
+    async def test_closes_connections_the_server_will_close(self) -> None:
+        close = http_response(200, completion("ok"), "Connection: close")
+        async with ScriptedServer([close, close]) as server:
+            client = self.client(server.url)
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+            await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(server.connections, 2)
+
+    async def test_parses_chunk_extensions_and_split_events(self) -> None:
+        events = b'data: {"choices": [{"delta": {"content": "he"}}]}\n\ndata: {"choices": [{"delta": {"content": "llo"}}]}\n\ndata: [DONE]\n\n'
+        chunks = [events[:5], events[5:40], events[40:]]
+        body = b"".join(f"{len(chunk):x};ext=1\r\n".encode() + chunk + b"\r\n" for chunk in chunks) + b"0\r\n\r\n"
+        head = b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n"
+        async with ScriptedServer([head + body, http_response(200, completion("again"))]) as server:
+            client = self.client(server.url)
+            deltas = [delta async for delta in client.stream_chat_completion(PAYLOAD, "key", "Adversary")]
+            body = await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(deltas, ["he", "llo"])
+        self.assertEqual(body["choices"][0]["message"]["content"], "again")
+        self.assertEqual(server.connections, 1)
+
+    async def test_stream_falls_back_to_a_plain_completion(self) -> None:
+        async with ScriptedServer([http_response(200, completion("whole"), "Content-Type: application/json")]) as server:
+            client = self.client(server.url)
+            deltas = [delta async for delta in client.stream_chat_completion(PAYLOAD, "key", "Adversary")]
+        self.assertEqual(deltas, ["whole"])
+
+    async def test_chunked_body_cut_off_mid_stream_is_an_error(self) -> None:
+        event = b'data: {"choices": [{"delta": {"content": "{\\"candidate_findings\\": [{\\"a\\""}}]}\n\n'
+        head = (
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        for cut in (b"", b"1", b"40\r\npartial"):
+            with self.subTest(cut=cut):
+                truncated = head + f"{len(event):x}\r\n".encode() + event + b"\r\n" + cut
+                async with ScriptedServer([truncated]) as server:
+                    client = self.client(server.url)
+                    deltas: list[str] = []
+                    with self.assertRaisesRegex(K2RequestError, "stream interrupted"):
+                        async for delta in client.stream_chat_completion(PAYLOAD, "key", "Adversary"):
+                            deltas.append(delta)
+                self.assertEqual(deltas, ['{"candidate_findings": [{"a"'])
+
+    async def test_chunked_completion_cut_off_is_retried(self) -> None:
+        truncated = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n5\r\n{\"cho\r\n"
+        async with ScriptedServer([truncated, http_response(200, completion("ok"))]) as server:
+            client = self.client(server.url)
+            body = await client.chat_completion(PAYLOAD, "key", "Adversary")
+        self.assertEqual(body["choices"][0]["message"]["content"], "ok")
+        self.assertEqual(len(self.retries), 1)
+
+    async def test_event_stream_without_done_or_finish_reason_is_an_error(self) -> None:
+        events = b'data: {"choices": [{"delta": {"content": "{\\"a\\""}}]}\n\n'
+        head = f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nContent-Length: {len(events)}\r\n\r\n"
+        async with ScriptedServer([head.encode() + events]) as server:
+            client = self.client(server.url)
+            with self.assertRaisesRegex(K2RequestError, r"ended before \[DONE\]"):
+                async for _ in client.stream_chat_completion(PAYLOAD, "key", "Adversary"):
+                    pass
+
+    async def test_finish_reason_ends_a_stream_without_done(self) -> None:
+        events = (
+            b'data: {"choices": [{"delta": {"content": "ok"}}]}\n\n'
+            b'data: {"choices": [{"delta": {}, "finish_reason": "stop"}]}\n\n'
+        )
+        head = f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nContent-Length: {len(events)}\r\n\r\n"
+        async with ScriptedServer([head.encode() + events]) as server:
+            client = self.client(server.url)
+            deltas = [delta async for delta in client.stream_chat_completion(PAYLOAD, "key", "Adversary")]
+        self.assertEqual(deltas, ["ok"])
+
+    async def test_rejects_malformed_stream_events(self) -> None:
+        events = b"data: {not json}\n\n"
+        head = f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nContent-Length: {len(events)}\r\n\r\n"
+        async with ScriptedServer([head.encode() + events]) as server:
+            client = self.client(server.url)
+            with self.assertRaisesRegex(K2RequestError, "malformed stream event"):
+                async for _ in client.stream_chat_completion(PAYLOAD, "key", "Adversary"):
+                    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+from typing import Any
+from unittest import mock
+
+from backend import main
+
+
+def candidate(name: str, confidence: float) -> dict[str, Any]:
+    return {"error_name": name, "location": f"src/{name}.js:1", "confidence": confidence}
+
+
+def verdict(item: dict[str, Any]) -> dict[str, Any]:
+    return {"keep": True, "error_name": item["error_name"], "location": item["location"]}
+
+
+class HuntAndRoastTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.events: list[dict[str, Any]] = []
+        self.batches: list[list[str]] = []
+        main._event_sink.set(self.events.append)
+
+    async def fake_roaster(self, api_key: str, candidates: list[dict[str, Any]], cache_scope: str):
+        self.batches.append([item["error_name"] for item in candidates])
+        await asyncio.sleep(0)
+        return [[verdict(item)] for item in candidates], "raw"
+
+    async def hunt(self) -> tuple[dict[str, Any], list[list[str]]]:
+        return await main.hunt_and_roast("key", {}, {}, None, {}, [["a.js"], ["b.js"]], "scope", "summary")
+
+    async def test_roasts_while_hunting_and_audits_in_reduced_order(self) -> None:
+        released = asyncio.Event()
+        streamed = [candidate("low", 0.2), candidate("high", 0.9), candidate("low", 0.2), candidate("mid", 0.5)]
+
+        async def fan_out(*args: Any) -> tuple[dict[str, Any], str, list[list[str]]]:
+            on_candidate = args[-1]
+            on_candidate(streamed[0])
+            await released.wait()
+            for item in streamed[1:]:
+                on_candidate(item)
+            return {"candidate_findings": streamed}, "raw", []
+
+        async def roaster(*args: Any):
+            released.set()
+            return await self.fake_roaster(*args)
+
+        with mock.patch.object(main, "fan_out_adversary", fan_out), mock.patch.object(main, "run_roaster", roaster):
+            roasted, failed = await self.hunt()
+
+        self.assertEqual(self.batches[0], ["low"], "the Roaster should start before the Adversary finishes")
+        self.assertEqual(sorted(name for batch in self.batches for name in batch), ["high", "low", "mid"])
+        self.assertEqual([item["error_name"] for item in roasted["roasted_findings"]], ["high", "mid", "low"])
+        self.assertEqual(failed, [])
+        announced = [event["candidate"]["error_name"] for event in self.events if event["type"] == "candidate"]
+        self.assertEqual(announced, ["low", "high", "mid"])
+
+    async def test_roasts_candidates_the_stream_missed(self) -> None:
+        async def fan_out(*args: Any) -> tuple[dict[str, Any], str, list[list[str]]]:
+            return {"candidate_findings": [candidate("repaired", 0.7)]}, "raw", [["b.js"]]
+
+        with mock.patch.object(main, "fan_out_adversary", fan_out), mock.patch.object(
+            main, "run_roaster", self.fake_roaster
+        ):
+            roasted, failed = await self.hunt()
+
+        self.assertEqual(self.batches, [["repaired"]])
+        self.assertEqual([item["error_name"] for item in roasted["roasted_findings"]], ["repaired"])
+        self.assertEqual(failed, [["b.js"]])
+
+    async def test_output_does_not_depend_on_batching(self) -> None:
+        items = [candidate(f"c{position}", position / 10) for position in range(6)]
+        results = []
+        for pause_every in (1, 2, 6):
+
+            async def fan_out(*args: Any) -> tuple[dict[str, Any], str, list[list[str]]]:
+                for position, item in enumerate(items):
+                    args[-1](item)
+                    if position % pause_every == 0:
+                        await asyncio.sleep(0)
+                return {"candidate_findings": list(reversed(items))}, "raw", []
+
+            with mock.patch.object(main, "fan_out_adversary", fan_out), mock.patch.object(
+                main, "run_roaster", self.fake_roaster
+            ):
+                roasted, _ = await self.hunt()
+            results.append(roasted)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+
+    async def test_cancelling_stops_the_roaster(self) -> None:
+        roasting = asyncio.Event()
+        roaster_cancelled = asyncio.Event()
+
+        async def fan_out(*args: Any) -> tuple[dict[str, Any], str, list[list[str]]]:
+            args[-1](candidate("first", 0.5))
+            await asyncio.Event().wait()
+
+        async def roaster(*args: Any):
+            roasting.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                roaster_cancelled.set()
+                raise
+
+        with mock.patch.object(main, "fan_out_adversary", fan_out), mock.patch.object(main, "run_roaster", roaster):
+            task = asyncio.create_task(self.hunt())
+            await asyncio.wait_for(roasting.wait(), 1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.wait_for(roaster_cancelled.wait(), 1)
+
+    async def test_adversary_failure_cancels_the_roaster(self) -> None:
+        roaster_cancelled = asyncio.Event()
+
+        async def fan_out(*args: Any) -> tuple[dict[str, Any], str, list[list[str]]]:
+            args[-1](candidate("first", 0.5))
+            await asyncio.sleep(0)
+            raise main.K2RequestError("every shard failed")
+
+        async def roaster(*args: Any):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                roaster_cancelled.set()
+                raise
+
+        with mock.patch.object(main, "fan_out_adversary", fan_out), mock.patch.object(main, "run_roaster", roaster):
+            with self.assertRaises(main.K2RequestError):
+                await self.hunt()
+        await asyncio.wait_for(roaster_cancelled.wait(), 1)
+
+
+class AssignVerdictsTests(unittest.TestCase):
+    def test_matches_on_candidate_key_then_order(self) -> None:
+        first, second, third = candidate("first", 0.1), candidate("second", 0.2), candidate("third", 0.3)
+        judged = [verdict(third), {"keep": False, "error_name": "renamed"}, verdict(first), "stray"]
+        assigned = main.assign_verdicts([first, second, third], judged)
+        self.assertEqual(assigned[0], [verdict(first)])
+        self.assertEqual(assigned[1], [{"keep": False, "error_name": "renamed"}])
+        self.assertEqual(assigned[2], [verdict(third), "stray"])
+
+
+if __name__ == "__main__":
+    unittest.main()
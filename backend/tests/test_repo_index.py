@@ -0,0 +1,30 @@
+import re
+import unittest
+
+from backend.loadtest import synthetic_workspace
+from backend.repo_index import build_repo_index, plan_shards, render_context
+
+FILE_HEADER = re.compile(r"^### FILE: (.+)$", re.MULTILINE)
+
+
+class ShardRenderingTests(unittest.TestCase):
+    def assert_every_shard_renders_in_full(self, files: dict[str, str], budget: int) -> None:
+        index = build_repo_index(files)
+        shards = plan_shards(index, budget)
+        self.assertEqual(sorted(path for shard in shards for path in shard), sorted(files))
+        for shard in shards:
+            with self.subTest(shard=shard[0]):
+                text = render_context(index, files, shard, budget, sorted(index.neighbours(shard)))
+                self.assertEqual(set(FILE_HEADER.findall(text)), set(shard))
+
+    def test_packed_shards_render_every_file(self) -> None:
+        files = {entry["path"]: entry["content"] for entry in synthetic_workspace(1000)}
+        self.assert_every_shard_renders_in_full(files, 16000)
+
+    def test_long_paths_and_tiny_files_fit_a_tight_budget(self) -> None:
+        files = {f"src/{'deeply/nested/' * 6}module_{number:03d}.js": "x;\n" * (number % 7) for number in range(120)}
+        self.assert_every_shard_renders_in_full(files, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
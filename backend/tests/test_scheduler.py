@@ -0,0 +1,178 @@
+import asyncio
+import unittest
+from typing import Any, AsyncIterator
+from unittest import mock
+
+from fastapi import HTTPException
+
+from backend import main
+from backend.scheduler import JobScheduler, Priority, SchedulerBusy
+
+
+async def collect(events: AsyncIterator[dict[str, Any]]) -> list[dict[str, Any]]:
+    return [event async for event in events]
+
+
+class JobSchedulerTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.scheduler = JobScheduler(workers=1, interactive_workers=0, max_queued=2, retry_after=7)
+        self.started: list[str] = []
+        self.gate = asyncio.Event()
+
+    async def asyncTearDown(self) -> None:
+        await self.scheduler.close()
+
+    def factory(self, name: str, wait: bool = True):
+        async def run() -> AsyncIterator[dict[str, Any]]:
+            self.started.append(name)
+            yield {"type": "log", "message": f"{name} started"}
+            if wait:
+                await self.gate.wait()
+            yield {"type": "done", "summary": {"run_id": name}}
+
+        return run
+
+    async def test_interactive_jobs_run_before_batch_jobs(self) -> None:
+        blocker, _ = self.scheduler.submit("blocker", Priority.BATCH, self.factory("blocker"))
+        await asyncio.sleep(0)
+        jobs = [
+            self.scheduler.submit("batch", Priority.BATCH, self.factory("batch"))[0],
+            self.scheduler.submit("first", Priority.INTERACTIVE, self.factory("first"))[0],
+            self.scheduler.submit("second", Priority.INTERACTIVE, self.factory("second"))[0],
+        ]
+        self.gate.set()
+        await asyncio.gather(*(collect(self.scheduler.subscribe(job)) for job in [blocker, *jobs]))
+        self.assertEqual(self.started, ["blocker", "first", "second", "batch"])
+
+    async def test_interactive_workers_are_not_starved_by_batch_jobs(self) -> None:
+        scheduler = JobScheduler(workers=1, interactive_workers=1)
+        try:
+            scheduler.submit("batch", Priority.BATCH, self.factory("batch"))
+            await asyncio.sleep(0)
+            job, _ = scheduler.submit("interactive", Priority.INTERACTIVE, self.factory("interactive", wait=False))
+            events = await asyncio.wait_for(collect(scheduler.subscribe(job)), 1)
+            self.assertEqual(events[-1]["type"], "done")
+        finally:
+            await scheduler.close()
+
+    async def test_rejects_submissions_beyond_max_queued(self) -> None:
+        self.scheduler.submit("running", Priority.BATCH, self.factory("running"))
+        await asyncio.sleep(0)
+        self.scheduler.submit("queued-1", Priority.BATCH, self.factory("queued-1"))
+        self.scheduler.submit("queued-2", Priority.BATCH, self.factory("queued-2"))
+        with self.assertRaises(SchedulerBusy) as raised:
+            self.scheduler.submit("queued-3", Priority.BATCH, self.factory("queued-3"))
+        self.assertEqual(raised.exception.retry_after, 7)
+        # The other priority has its own queue.
+        self.scheduler.submit("interactive", Priority.INTERACTIVE, self.factory("interactive"))
+
+    async def test_submit_job_answers_429_with_retry_after(self) -> None:
+        with mock.patch.object(main, "scheduler", self.scheduler):
+            main.submit_job("running", Priority.BATCH, self.factory("running"))
+            await asyncio.sleep(0)
+            main.submit_job("queued-1", Priority.BATCH, self.factory("queued-1"))
+            main.submit_job("queued-2", Priority.BATCH, self.factory("queued-2"))
+            with self.assertRaises(HTTPException) as raised:
+                main.submit_job("queued-3", Priority.BATCH, self.factory("queued-3"))
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(raised.exception.headers, {"Retry-After": "7"})
+
+    async def test_archive_upload_is_refused_before_the_body_is_read(self) -> None:
+        self.scheduler.submit("running", Priority.BATCH, self.factory("running"))
+        await asyncio.sleep(0)
+        self.assertTrue(self.scheduler.has_capacity(Priority.BATCH))
+        self.scheduler.submit("queued-1", Priority.BATCH, self.factory("queued-1"))
+        self.scheduler.submit("queued-2", Priority.BATCH, self.factory("queued-2"))
+        self.assertFalse(self.scheduler.has_capacity(Priority.BATCH))
+        self.assertTrue(self.scheduler.has_capacity(Priority.INTERACTIVE))
+
+        request = mock.Mock()
+        request.stream.side_effect = AssertionError("upload body was read")
+        with mock.patch.object(main, "scheduler", self.scheduler), self.assertRaises(HTTPException) as raised:
+            await main.stream_archive_audit(request)
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertEqual(raised.exception.headers, {"Retry-After": "7"})
+        request.stream.assert_not_called()
+
+    async def test_duplicate_submission_replays_the_running_job(self) -> None:
+        cleaned: list[str] = []
+        job, created = self.scheduler.submit("same", Priority.BATCH, self.factory("same"), lambda: cleaned.append("x"))
+        first = asyncio.create_task(collect(self.scheduler.subscribe(job)))
+        await asyncio.sleep(0.01)
+
+        again, created_again = self.scheduler.submit("same", Priority.BATCH, self.factory("other"))
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertIs(again, job)
+        late = asyncio.create_task(collect(self.scheduler.subscribe(again)))
+        self.gate.set()
+
+        self.assertEqual(await first, await late)
+        self.assertEqual([event["type"] for event in await late], ["log", "done"])
+        self.assertEqual(self.started, ["same"])
+        self.assertEqual(cleaned, ["x"])
+
+    async def test_finished_job_is_not_reused(self) -> None:
+        job, _ = self.scheduler.submit("same", Priority.BATCH, self.factory("same", wait=False))
+        await collect(self.scheduler.subscribe(job))
+        again, created = self.scheduler.submit("same", Priority.BATCH, self.factory("same", wait=False))
+        self.assertTrue(created)
+        self.assertIsNot(again, job)
+        await collect(self.scheduler.subscribe(again))
+
+    async def test_last_unsubscribe_cancels_a_running_job(self) -> None:
+        cancelled = asyncio.Event()
+
+        async def run() -> AsyncIterator[dict[str, Any]]:
+            yield {"type": "log", "message": "started"}
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            yield {"type": "done"}
+
+        job, _ = self.scheduler.submit("same", Priority.BATCH, run)
+        events = self.scheduler.subscribe(job)
+        self.assertEqual((await anext(events))["type"], "log")
+        await events.aclose()
+
+        # The cancelled job is forgotten at once, so the same key starts a new run.
+        again, created = self.scheduler.submit("same", Priority.BATCH, self.factory("again", wait=False))
+        self.assertTrue(created)
+        self.assertIsNot(again, job)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        self.assertTrue(job.finished)
+        self.assertEqual((await collect(self.scheduler.subscribe(again)))[-1]["type"], "done")
+
+    async def test_last_unsubscribe_drops_a_queued_job(self) -> None:
+        cleaned: list[str] = []
+        self.scheduler.submit("running", Priority.BATCH, self.factory("running"))
+        await asyncio.sleep(0)
+        job, _ = self.scheduler.submit("queued", Priority.BATCH, self.factory("queued"), lambda: cleaned.append("x"))
+        events = self.scheduler.subscribe(job)
+        waiting = asyncio.create_task(anext(events))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        self.assertEqual(self.scheduler.stats()["queued_batch"], 0)
+        self.assertTrue(job.finished)
+        self.assertEqual(cleaned, ["x"])
+        self.gate.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.started, ["running"])
+
+    async def test_a_remaining_subscriber_keeps_the_job_alive(self) -> None:
+        job, _ = self.scheduler.submit("same", Priority.BATCH, self.factory("same"))
+        leaving = self.scheduler.subscribe(job)
+        staying = asyncio.create_task(collect(self.scheduler.subscribe(job)))
+        await anext(leaving)
+        await leaving.aclose()
+        self.gate.set()
+        self.assertEqual([event["type"] for event in await staying], ["log", "done"])
+
+
+if __name__ == "__main__":
+    unittest.main()
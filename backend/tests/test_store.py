@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from backend.store import AgentCache, ResultStore, content_hash, open_database
+
+
+def stored_bytes(cache: AgentCache) -> int:
+    return cache.connection.execute("SELECT COALESCE(SUM(size), 0) FROM agent_cache").fetchone()[0]
+
+
+class AgentCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.connection = open_database(":memory:")
+        self.addCleanup(self.connection.close)
+        self.cache = AgentCache(self.connection, max_bytes=100, ttl_seconds=60)
+
+    def test_evicts_least_recently_used_entries_past_max_bytes(self) -> None:
+        with mock.patch("backend.store.time.time", side_effect=range(1, 100)):
+            for key in "abc":
+                self.cache.put(key, key * 30)
+            self.cache.get("a")
+            self.cache.put("d", "d" * 30)
+            self.assertEqual([self.cache.get(key) is not None for key in "abcd"], [True, False, True, True])
+        self.assertEqual(self.cache._total, stored_bytes(self.cache))
+
+    def test_running_total_follows_replacements_and_expiry(self) -> None:
+        with mock.patch("backend.store.time.time", return_value=1000.0):
+            self.cache.put_many([("a", "x" * 10), ("b", "y" * 20)])
+            self.cache.put("a", "z" * 5)
+        self.assertEqual(self.cache._total, 25)
+
+        with mock.patch("backend.store.time.time", return_value=1061.0):
+            self.assertIsNone(self.cache.get("a"))
+            self.assertEqual(self.cache._total, 20)
+            self.cache.put("c", "c")
+        self.assertEqual((self.cache._total, stored_bytes(self.cache)), (1, 1))
+
+    def test_skips_values_larger_than_the_cache(self) -> None:
+        self.cache.put("big", "x" * 101)
+        self.assertIsNone(self.cache.get("big"))
+        self.assertEqual(self.cache._total, 0)
+
+    def test_total_is_loaded_from_an_existing_database(self) -> None:
+        self.cache.put_many([("a", "x" * 10), ("b", "y" * 20)])
+        self.assertEqual(AgentCache(self.connection, max_bytes=100, ttl_seconds=60)._total, 30)
+
+
+class ResultStoreRetentionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.connection = open_database(":memory:")
+        self.addCleanup(self.connection.close)
+
+    def store(self, **limits: float) -> ResultStore:
+        return ResultStore(self.connection, prune_interval=float("inf"), **limits)
+
+    def save(self, store: ResultStore, run_id: str, at: float, files: dict[str, str]) -> None:
+        with mock.patch("backend.store.time.time", return_value=at):
+            store.save_snapshot(run_id, files.items(), {})
+            store.save(run_id, {"run_id": run_id})
+
+    def blob_count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+    def test_prunes_by_age_and_collects_unreferenced_blobs(self) -> None:
+        store = self.store(max_age_seconds=100)
+        self.save(store, "old", 1000, {"a.js": "old", "shared.js": "shared"})
+        self.save(store, "new", 1050, {"a.js": "new", "shared.js": "shared"})
+        with mock.patch("backend.store.time.time", return_value=1120):
+            self.assertEqual(store.prune(), {"runs": 1, "run_snapshots": 1, "blobs": 1})
+        self.assertIsNone(store.get("old"))
+        self.assertIsNone(store.get_snapshot("old"))
+        self.assertIsNone(store.get_blob(content_hash("old")))
+        manifest, _ = store.get_snapshot("new")
+        self.assertEqual({path: store.get_blob(digest) for path, digest in manifest.items()}, {"a.js": "new", "shared.js": "shared"})
+
+    def test_keeps_the_newest_max_count_runs(self) -> None:
+        store = self.store(max_count=2)
+        for position in range(4):
+            self.save(store, f"run{position}", 1000 + position, {"a.js": f"v{position}"})
+        store.prune()
+        self.assertEqual([store.get(f"run{position}") is not None for position in range(4)], [False, False, True, True])
+        self.assertEqual(self.blob_count(), 2)
+
+    def test_saving_prunes_once_per_interval(self) -> None:
+        store = ResultStore(self.connection, max_count=1, prune_interval=60)
+        self.save(store, "first", 1000, {"a.js": "1"})
+        self.save(store, "second", 1010, {"a.js": "2"})
+        self.assertIsNotNone(store.get("first"))
+        self.save(store, "third", 1070, {"a.js": "3"})
+        # The snapshot save pruned, before the third run record was written.
+        self.assertEqual([store.get(run_id) is not None for run_id in ("first", "second", "third")], [False, True, True])
+        self.assertEqual([store.get_snapshot(run_id) is not None for run_id in ("second", "third")], [False, True])
+        self.assertEqual(self.blob_count(), 1)
+
+    def test_no_limits_keeps_everything(self) -> None:
+        store = self.store()
+        self.save(store, "run", 0, {"a.js": "a"})
+        self.assertEqual(store.prune(), {"runs": 0, "run_snapshots": 0, "blobs": 0})
+
+    def test_dates_snapshots_from_before_the_created_at_column(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "old.sqlite3")
+        legacy = sqlite3.connect(path)
+        legacy.execute("CREATE TABLE run_snapshots (run_id TEXT PRIMARY KEY, manifest TEXT NOT NULL, stages TEXT NOT NULL)")
+        legacy.execute("INSERT INTO run_snapshots VALUES ('legacy', '{}', '{}')")
+        legacy.commit()
+        legacy.close()
+
+        with mock.patch("backend.store.time.time", return_value=5000.0):
+            connection = open_database(path)
+        self.addCleanup(connection.close)
+        store = ResultStore(connection, max_age_seconds=100, prune_interval=float("inf"))
+        with mock.patch("backend.store.time.time", return_value=5050.0):
+            store.prune()
+        self.assertEqual(store.get_snapshot("legacy"), ({}, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()